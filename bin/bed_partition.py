@@ -0,0 +1,119 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   split several BED files into matching per-chromosome partitions (and, with
+#   chunk_bp, sub-chromosome chunks) so that a pairwise operation can run on each
+#   partition in its own process; the files are streamed line by line, so memory
+#   is bounded by one partition rather than by the inputs
+#
+#   chunks are cut only at positions that no interval of any input spans, so every
+#   interval and every overlap falls in exactly one partition and per-partition
+#   bp sums, element counts and label sets reduce exactly to the whole-file result
+#
+#   depends on:
+#       numpy
+#       bed_reader.py, numpy_engine.py (same directory)
+###
+
+import os
+import sys
+import numpy as np
+from bisect import bisect_right
+
+from bed_reader import HEADER_PREFIXES, open_bed, read_bed
+from numpy_engine import merge_intervals
+
+
+# lines held per partition file before they are appended to disk
+BUFFER_LINES = 10000
+
+
+###
+#   functions
+###
+def flush(buffers, paths, key):
+    with open(paths[key], 'a') as outfile:
+        outfile.write(''.join(buffers[key]))
+    buffers[key] = []
+
+
+def split_lines(filename, route, paths, new_path):
+    # append every data line of filename to paths[route(line)], buffered per destination;
+    # destinations not in paths yet get new_path(key)
+    buffers = {}
+    infile = open_bed(filename)
+    try:
+        for line in infile:
+            if line.startswith(HEADER_PREFIXES) or not line.strip():
+                continue
+            key = route(line)
+            if key not in buffers:
+                buffers[key] = []
+                if key not in paths:
+                    paths[key] = new_path(key)
+            buffers[key].append(line if line.endswith('\n') else line + '\n')
+            if len(buffers[key]) == BUFFER_LINES:
+                flush(buffers, paths, key)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+
+    for key in buffers:
+        if buffers[key]:
+            flush(buffers, paths, key)
+
+
+def empty_file(path):
+    open(path, 'w').close()
+    return path
+
+
+def safe_cuts(filenames, chunk_bp):
+    # positions about chunk_bp apart that fall between intervals of every input:
+    # the ends of merged intervals of the union, taken where they cross a chunk_bp multiple
+    beds = [read_bed(filename) for filename in filenames]
+    starts = np.concatenate([bed['start'] for bed in beds])
+    ends = np.concatenate([bed['end'] for bed in beds])
+    _, merged_ends = merge_intervals(starts, ends)
+
+    crossed = merged_ends[1:] // chunk_bp > merged_ends[:-1] // chunk_bp
+    return merged_ends[:-1][crossed]
+
+
+def partition_beds(filenames, outdir, chunk_bp=0):
+    # returns one tuple of paths (one per input, an empty file where an input has no
+    # intervals there) per partition; chunk_bp > 0 also cuts each chromosome into pieces
+    # of roughly that many bp. every input is read once, so '-' (stdin) works
+    chroms = {}
+    paths = []
+    for i, filename in enumerate(filenames):
+        new_path = lambda c: empty_file(os.path.join(outdir, '{}.{}.bed'.format(i, chroms.setdefault(c, len(chroms)))))
+        chrom_paths = {}
+        split_lines(filename, lambda line: line.split(None, 1)[0], chrom_paths, new_path)
+        paths.append(chrom_paths)
+
+    partitions = [tuple(chrom_paths.get(c) or empty_file(os.path.join(outdir, '{}.{}.bed'.format(i, j)))
+                        for i, chrom_paths in enumerate(paths)) for c, j in chroms.items()]
+    if chunk_bp <= 0:
+        return partitions
+
+    chunks = []
+    for partition in partitions:
+        cuts = safe_cuts(partition, chunk_bp).tolist()
+        if len(cuts) == 0:
+            chunks.append(partition)
+            continue
+
+        # an interval starting exactly at a cut belongs to the chunk after it
+        route = lambda line: bisect_right(cuts, int(line.split(None, 2)[1]))
+        pieces = []
+        for path in partition:
+            piece_paths = {k: empty_file('{}.{}.bed'.format(path[:-len('.bed')], k)) for k in range(len(cuts) + 1)}
+            split_lines(path, route, piece_paths, None)
+            os.remove(path)
+            pieces.append(piece_paths)
+        chunks.extend(tuple(piece_paths[k] for piece_paths in pieces) for k in range(len(cuts) + 1))
+
+    return chunks
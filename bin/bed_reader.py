@@ -0,0 +1,123 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   shared BED loader for the scripts in bin/; reads BED3/BED6+ into columnar
+#   numpy arrays without going through bedtools
+#
+#   header lines ('#', 'track', 'browser') and blank lines are skipped, and the
+#   coordinate columns may be separated by any mix of spaces and tabs (as in the
+#   unfixed GWAS catalog files); the remaining columns are split on tabs when the
+#   line has any, so names with spaces survive
+#
+#   depends on:
+#       numpy
+###
+
+import sys
+import gzip
+import numpy as np
+
+
+# data lines are parsed and converted to arrays this many at a time
+CHUNK_SIZE = 500000
+
+HEADER_PREFIXES = ('#', 'track', 'browser')
+
+
+###
+#   functions
+###
+def open_bed(filename):
+    if filename == '-':
+        return sys.stdin
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt')
+    return open(filename, 'r', buffering=1 << 20)
+
+
+def split_fields(line):
+    fields = line.split(None, 3)
+    if len(fields) == 4:
+        rest = fields.pop().rstrip('\r\n')
+        fields.extend(rest.split('\t') if '\t' in rest else rest.split())
+    return fields
+
+
+def _columns(filename, rows, codes, keep_fields):
+    chroms = [f[0] for f in rows]
+    try:
+        starts = np.array([f[1] for f in rows]).astype(np.int64)
+        ends = np.array([f[2] for f in rows]).astype(np.int64)
+    except ValueError as e:
+        raise ValueError('{}: non-integer coordinate ({})'.format(filename, e))
+
+    chunk = {'chrom': np.array(chroms, dtype=object),
+             'chrom_code': np.fromiter((codes.setdefault(c, len(codes)) for c in chroms), dtype=np.int32, count=len(chroms)),
+             'start': starts,
+             'end': ends,
+             'name': np.array([f[3] if len(f) > 3 else '.' for f in rows], dtype=object),
+             'strand': np.array([f[5] if len(f) > 5 else '.' for f in rows], dtype=object),
+             'label': np.array([f[-1] for f in rows], dtype=object)}
+    if keep_fields:
+        chunk['extra'] = np.array(['\t'.join(f[3:]) for f in rows], dtype=object)
+
+    return chunk
+
+
+def iter_bed(filename, keep_fields=False, codes=None, chunk_size=CHUNK_SIZE):
+    # yields one dict of columns per chunk; chromosomes are coded in order of first
+    # appearance, shared across chunks (and across files when the same codes dict is passed)
+    codes = {} if codes is None else codes
+    rows = []
+
+    infile = open_bed(filename)
+    try:
+        for n, line in enumerate(infile, start=1):
+            if line.startswith(HEADER_PREFIXES) or not line.strip():
+                continue
+            fields = split_fields(line)
+            if len(fields) < 3:
+                raise ValueError('{}: line {} has fewer than 3 columns'.format(filename, n))
+            rows.append(fields)
+            if len(rows) == chunk_size:
+                yield _columns(filename, rows, codes, keep_fields)
+                rows = []
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+
+    if rows:
+        yield _columns(filename, rows, codes, keep_fields)
+
+
+def column_values(bed, column):
+    # values of a 1-based column as strings; columns past the third need keep_fields
+    if column <= 3:
+        return bed[('chrom', 'start', 'end')[column - 1]].astype(str)
+
+    rows = [x.split('\t') for x in bed['extra']]
+    if any(len(r) < column - 3 for r in rows):
+        raise ValueError('column {} is missing on some lines'.format(column))
+    return np.array([r[column - 4] for r in rows], dtype=object)
+
+
+def read_bed(filename, keep_fields=False, codes=None, chunk_size=CHUNK_SIZE):
+    # columns: chrom, chrom_code, start, end, name, strand, label (last column) and, with
+    # keep_fields, extra (columns 4 onward, tab-joined); chrom_names maps codes back to names
+    codes = {} if codes is None else codes
+    chunks = list(iter_bed(filename, keep_fields, codes, chunk_size))
+
+    if chunks:
+        bed = {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+    else:
+        bed = {'chrom': np.zeros(0, dtype=object), 'chrom_code': np.zeros(0, dtype=np.int32),
+               'start': np.zeros(0, dtype=np.int64), 'end': np.zeros(0, dtype=np.int64),
+               'name': np.zeros(0, dtype=object), 'strand': np.zeros(0, dtype=object),
+               'label': np.zeros(0, dtype=object)}
+        if keep_fields:
+            bed['extra'] = np.zeros(0, dtype=object)
+    bed['chrom_names'] = sorted(codes, key=codes.get)
+
+    return bed
@@ -0,0 +1,219 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   offline benchmarks for calculate_enrichment.py, calculate_jaccard.py and
+#   calculate_reg_domains.py; generates a synthetic genome (chrom sizes, blacklist,
+#   genes and interval sets at each scale) in a scratch directory, times every
+#   tool/engine/thread count and prints one tsv row per run:
+#
+#   tool  engine  intervals  threads  wall_s  cpu_s  peak_rss_mb  throughput  unit  speedup  status
+#
+#   cpu_s and peak_rss_mb include the tool's worker processes (peak is the largest
+#   single process); speedup is relative to the smallest thread count at that scale
+#
+#   depends on:
+#       numpy
+#       the scripts in the parent directory (and bedtools on PATH for --engines bedtools)
+###
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+
+BIN = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOLS = ['enrichment', 'jaccard', 'reg_domains']
+
+# jaccard is run as an all-pairs matrix over this many interval sets, and reg_domains as a
+# sweep over these maximum extensions (kb), so that both have work to spread over threads
+JACCARD_SETS = 4
+REG_EXTENSIONS = ['500', '1000', '1500', '2000']
+
+
+###
+#   arguments
+###
+arg_parser = argparse.ArgumentParser(description="Benchmark the bin/ tools on synthetic genomes.")
+
+arg_parser.add_argument("--scales", type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='number of intervals per set (1000 to 10000000); default=1000 10000 100000')
+arg_parser.add_argument("--threads", type=int, nargs='+', default=[1, 2, 4],
+                        help='thread counts to time; default=1 2 4')
+arg_parser.add_argument("--tools", type=str, nargs='+', default=TOOLS, choices=TOOLS,
+                        help='tools to time; default=all')
+arg_parser.add_argument("--engines", type=str, nargs='+', default=['numpy'], choices=['numpy', 'bedtools'],
+                        help='calculate_enrichment engines to time; default=numpy')
+arg_parser.add_argument("-i", "--iters", type=int, default=20,
+                        help='calculate_enrichment iterations per run; default=20')
+arg_parser.add_argument("--num_chroms", type=int, default=22,
+                        help='chromosomes in the synthetic genome; default=22')
+arg_parser.add_argument("--genome_size", type=float, default=3e9,
+                        help='total synthetic genome length in bp; default=3e9')
+arg_parser.add_argument("--seed", type=int, default=1,
+                        help='seed for the synthetic data and shuffles; default=1')
+arg_parser.add_argument("--workdir", type=str, default=None,
+                        help='directory for the synthetic data (kept); default=a temporary directory that is removed')
+arg_parser.add_argument("-o", "--outfile", type=str, default=None,
+                        help='write the results table here; default=stdout')
+
+args = arg_parser.parse_args()
+
+
+###
+#   synthetic data
+###
+def synthetic_genome(num_chroms, genome_size):
+    # decreasing chromosome lengths, roughly like a mammalian karyotype
+    weights = np.linspace(1.0, 0.2, num_chroms)
+    sizes = (weights / weights.sum() * genome_size).astype(np.int64)
+    return ['chr{}'.format(i + 1) for i in range(num_chroms)], sizes
+
+
+def random_intervals(rng, sizes, n, mean_length):
+    # n sorted, non-overlapping intervals; returns chromosome index, start, end
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    pos = np.unique(rng.integers(0, offsets[-1], n))
+    chrom = np.searchsorted(offsets, pos, side='right') - 1
+    limit = np.minimum(np.append(pos[1:], offsets[-1]), offsets[chrom + 1])
+    ends = np.minimum(pos + rng.integers(mean_length // 2, mean_length * 3 // 2 + 1, len(pos)), limit)
+
+    keep = ends > pos
+    return chrom[keep], (pos - offsets[chrom])[keep], (ends - offsets[chrom])[keep]
+
+
+def write_intervals(filename, names, chrom, starts, ends, extra=None, chunk_size=1000000):
+    with open(filename, 'w') as outfile:
+        for i in range(0, len(starts), chunk_size):
+            rows = zip(chrom[i:i + chunk_size], starts[i:i + chunk_size], ends[i:i + chunk_size])
+            if extra is None:
+                outfile.write(''.join('{}\t{}\t{}\n'.format(names[c], s, e) for c, s, e in rows))
+            else:
+                outfile.write(''.join('{}\t{}\t{}\t{}\n'.format(names[c], s, e, x) for (c, s, e), x in zip(rows, extra[i:i + chunk_size])))
+
+
+def make_genome(workdir, rng, num_chroms, genome_size):
+    names, sizes = synthetic_genome(num_chroms, genome_size)
+
+    chrom_sizes = os.path.join(workdir, 'synthetic.chrom.sizes')
+    with open(chrom_sizes, 'w') as outfile:
+        outfile.write(''.join('{}\t{}\n'.format(c, s) for c, s in zip(names, sizes)))
+
+    blacklist = os.path.join(workdir, 'blacklist.bed')
+    write_intervals(blacklist, names, *random_intervals(rng, sizes, 200, 100000))
+
+    return names, sizes, chrom_sizes, blacklist
+
+
+def make_inputs(workdir, rng, names, sizes, scale):
+    # interval sets cover about 10% of the genome at most, so shuffles stay feasible
+    mean_length = int(min(500, 0.1 * sizes.sum() / scale))
+    sets = []
+    for k in range(max(2, JACCARD_SETS)):
+        filename = os.path.join(workdir, 'set{}.{}.bed'.format(k, scale))
+        write_intervals(filename, names, *random_intervals(rng, sizes, scale, max(mean_length, 2)))
+        sets.append(filename)
+
+    genes = os.path.join(workdir, 'genes.{}.bed'.format(scale))
+    chrom, starts, ends = random_intervals(rng, sizes, scale, max(mean_length, 2))
+    strands = np.where(rng.random(len(starts)) < 0.5, '+', '-')
+    write_intervals(genes, names, chrom, starts, ends, ['g{}\t0\t{}'.format(i, s) for i, s in enumerate(strands)])
+
+    return sets, genes
+
+
+###
+#   timing
+###
+def run(cmd, log_fn):
+    # wall time, cpu time and peak rss of cmd and the children it waited for
+    with open(log_fn, 'w') as log:
+        begin = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=log)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - begin
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    return wall, usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024, proc.returncode
+
+
+def commands(tool, engine, threads, scale, sets, genes, chrom_sizes, blacklist, workdir):
+    # command line, work units and unit name for one run
+    python = sys.executable
+    if tool == 'enrichment':
+        cmd = [python, os.path.join(BIN, 'calculate_enrichment.py'), sets[0], sets[1], '-g', chrom_sizes, '-b', blacklist,
+               '--engine', engine, '--cache_dir', os.path.join(workdir, 'cache'), '--seed', str(args.seed),
+               '-i', str(args.iters), '-n', str(threads),
+               # one batch per thread, so small -i runs still spread over every thread
+               '--batch_size', str(-(-args.iters // threads))]
+        return cmd, scale * args.iters, 'shuffled_intervals/s'
+    if tool == 'jaccard':
+        cmd = [python, os.path.join(BIN, 'calculate_jaccard.py')] + sets[:JACCARD_SETS] + \
+              ['--matrix', os.path.join(workdir, 'jaccard.tsv'), '-n', str(threads)]
+        return cmd, scale * JACCARD_SETS, 'intervals/s'
+    cmd = [python, os.path.join(BIN, 'calculate_reg_domains.py'), genes, '-g', chrom_sizes, '-e', ','.join(REG_EXTENSIONS),
+           '-n', str(threads), '-o', os.path.join(workdir, 'domains.bed')]
+    return cmd, scale * len(REG_EXTENSIONS), 'domains/s'
+
+
+def runs(tools, engines):
+    for tool in tools:
+        for engine in (engines if tool == 'enrichment' else ['-']):
+            if engine == 'bedtools' and shutil.which('bedtools') is None:
+                print('skipping the bedtools engine: bedtools is not on PATH', file=sys.stderr)
+                continue
+            yield tool, engine
+
+
+###
+#   main
+###
+def main(argv):
+    workdir = args.workdir if args.workdir is not None else tempfile.mkdtemp(prefix='bin_benchmarks.')
+    os.makedirs(workdir, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    outfile = open(args.outfile, 'w') if args.outfile else sys.stdout
+
+    try:
+        names, sizes, chrom_sizes, blacklist = make_genome(workdir, rng, args.num_chroms, args.genome_size)
+        outfile.write('tool\tengine\tintervals\tthreads\twall_s\tcpu_s\tpeak_rss_mb\tthroughput\tunit\tspeedup\tstatus\n')
+
+        warm = False
+        tool_engines = list(runs(args.tools, args.engines))
+        for scale in sorted(args.scales):
+            sets, genes = make_inputs(workdir, rng, names, sizes, scale)
+
+            for tool, engine in tool_engines:
+                if tool == 'enrichment' and engine == 'numpy' and not warm:
+                    # build the allowed-segment cache outside the timed runs
+                    cmd = commands(tool, engine, 1, scale, sets, genes, chrom_sizes, blacklist, workdir)[0]
+                    cmd[cmd.index('-i') + 1] = '1'
+                    run(cmd, os.devnull)
+                    warm = True
+
+                base = None
+                for threads in sorted(args.threads):
+                    cmd, units, unit = commands(tool, engine, threads, scale, sets, genes, chrom_sizes, blacklist, workdir)
+                    log_fn = os.path.join(workdir, '{}.{}.{}.{}.log'.format(tool, engine, scale, threads))
+                    wall, cpu, rss, status = run(cmd, log_fn)
+                    base = wall if base is None else base
+
+                    outfile.write('{}\t{}\t{}\t{}\t{:.3f}\t{:.3f}\t{:.1f}\t{:.1f}\t{}\t{:.2f}\t{}\n'.format(
+                        tool, engine, scale, threads, wall, cpu, rss, units / wall, unit, base / wall,
+                        'ok' if status == 0 else 'failed (see {})'.format(log_fn)))
+                    outfile.flush()
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
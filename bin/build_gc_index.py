@@ -0,0 +1,58 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   build the per-species GC bin index used by --gc_index in calculate_enrichment.py
+#   and generate_random_bed.py; run once per species and window size
+#
+#   depends on:
+#       gc_index.py, numpy_engine.py (same directory)
+###
+
+import sys
+import argparse
+
+import numpy_engine
+from gc_index import DEFAULT_WINDOW, build_gc_index
+
+
+###
+#   arguments
+###
+arg_parser = argparse.ArgumentParser(description="Build a GC-percent window index for GC-matched shuffles.")
+
+arg_parser.add_argument("sequence", help='genome sequence (FASTA, optionally gzipped, or .2bit with py2bit installed)')
+
+arg_parser.add_argument("-s", "--species", type=str, default='hg19', choices=['hg19', 'hg38', 'mm10', 'dm3', 'sacCer3'],
+                        help='species and assembly; default=hg19')
+
+arg_parser.add_argument("-g", "--chrom_sizes", type=str, default=None,
+                        help='chromosome sizes file used instead of --species (e.g. a synthetic genome); default=None')
+
+arg_parser.add_argument("-w", "--window", type=int, default=DEFAULT_WINDOW,
+                        help='window size in bp; default={}'.format(DEFAULT_WINDOW))
+
+arg_parser.add_argument("-o", "--outdir", type=str, default=None,
+                        help='index directory; default=CACHE_DIR/SPECIES.gcWINDOW (the sizes file name with -g)')
+
+arg_parser.add_argument("--cache_dir", type=str, default=numpy_engine.DEFAULT_CACHE_DIR,
+                        help='directory holding the default index location; default=$ALLOWED_GENOME_CACHE or ~/.cache/allowed_genome')
+
+args = arg_parser.parse_args()
+
+
+###
+#   main
+###
+def main(argv):
+    genome = numpy_engine.load_genome(args.species, args.chrom_sizes)
+    try:
+        print(build_gc_index(genome, args.sequence, args.window, args.outdir, args.cache_dir))
+    except ValueError as e:
+        print(f'ERROR: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -11,9 +11,14 @@
 #           | 2019.11.05
 #           | 2021.02.24
 #           | 2021.05.26
+#           | 2026.10.18
 #
 #   depends on:
 #       BEDtools v2.23.0-20 via pybedtools
+#       numpy_engine.py (same directory) for --engine numpy
+#       bed_partition.py (same directory) for --partition
+#       gc_index.py (same directory) for --gc_index
+#       enrichment_counts.py, enrichment_profile.py (same directory)
 #       /dors/capra_lab/users/bentonml/data/dna/[species]/[species]_blacklist_gap.bed
 #       /dors/capra_lab/data/dna/[species]/[species]-blacklist.bed
 #
@@ -22,59 +27,128 @@
 
 import os
 import sys, traceback
+import shutil
+import tempfile
 import argparse
 import datetime
+import time
 import numpy as np
 from functools import partial
 from multiprocessing import Pool
 from pybedtools import BedTool
 from pybedtools.helpers import BEDToolsError, cleanup, get_tempdir, set_tempdir
 
+import numpy_engine
+from bed_partition import partition_beds
+from bed_reader import column_values, read_bed
+from gc_index import load_gc_index, match_gc
+from enrichment_counts import (DEFAULT_BLACKLISTS, addEnrichmentArguments, countExtreme, countFilename, groupFilename,
+                               readManifest, reportCounts, resultHeader, writeCounts)
+from enrichment_profile import addAnnotationResult, addError, addTask, addTempBytes, newRunProfile, profiledTask, timed, writeProfile
+
 
 ###
 #   arguments
 ###
 arg_parser = argparse.ArgumentParser(description="Calculate enrichment between bed files.")
 
-arg_parser.add_argument("region_file_1", help='bed file 1 (shuffled)')
-arg_parser.add_argument("region_file_2", help='bed file 2 (not shuffled)')
+addEnrichmentArguments(arg_parser)
+
+arg_parser.add_argument("--checkpoint", type=str, default=None,
+                        help="append each finished iteration's count to this file as it completes; default=None")
+
+arg_parser.add_argument("--resume", action='store_true', default=False,
+                        help='skip iterations already recorded in --checkpoint; refused when the checkpoint was written with '
+                             'another seed, test file, annotation, overlap mode, genome, blacklist, engine or GC index; default=False')
+
+arg_parser.add_argument("--shard", type=str, default=None,
+                        help='run only shard i of N (i/N, from 1) of the iterations and write its counts to --print_counts_to; '
+                             'combine shards with merge_enrichment_counts.py; requires --seed; default=None')
+
+arg_parser.add_argument("--partition", action='store_true', default=False,
+                        help='split both bed files by chromosome and compute the observed overlap of the partitions in parallel '
+                             '(bedtools engine only); default=False')
+
+arg_parser.add_argument("--chunk_bp", type=int, default=0,
+                        help='with --partition, also cut chromosomes into chunks of about this many bp at positions no '
+                             'interval spans; default=0 (whole chromosomes)')
+
+arg_parser.add_argument("--adaptive", action='store_true', default=False,
+                        help='run iterations in rounds and stop once the p-value is resolved against --alpha; --iters is the maximum; default=False')
+
+arg_parser.add_argument("--alpha", type=float, default=0.05,
+                        help='significance level used to stop adaptive runs; default=0.05')
 
-arg_parser.add_argument("-i", "--iters", type=int, default=100,
-                        help='number of simulation iterations; default=100')
+arg_parser.add_argument("--bc_h", type=int, default=10,
+                        help='stop adaptive runs after this many simulations at least as extreme as observed (Besag-Clifford h); default=10')
 
-arg_parser.add_argument("-s", "--species", type=str, default='hg19', choices=['hg19', 'hg38', 'mm10', 'dm3', 'sacCer3'],
-                        help='species and assembly; default=hg19')
+arg_parser.add_argument("--round_size", type=int, default=1000,
+                        help='iterations per adaptive round; default=1000')
 
-arg_parser.add_argument("-b", "--blacklist", type=str, default=None,
-                        help='custom blacklist file; default=None')
+arg_parser.add_argument("--cache_dir", type=str, default=numpy_engine.DEFAULT_CACHE_DIR,
+                        help='directory of cached allowed-genome segments (numpy engine only); default=$ALLOWED_GENOME_CACHE or ~/.cache/allowed_genome')
 
-arg_parser.add_argument("-n", "--num_threads", type=int,
-                        help='number of threads; default=SLURM_CPUS_PER_TASK or 1')
+arg_parser.add_argument("--profile", type=str, default=None,
+                        help='write per-phase wall/cpu time, iteration latency percentiles, temp bytes written and '
+                             'peak RSS per worker to this JSON file; default=None')
 
-arg_parser.add_argument("--print_counts_to", type=str, default=None,
-                        help="print expected counts to file")
+# intermixed so that options may sit between the two bed files
+args = arg_parser.parse_intermixed_args()
 
-arg_parser.add_argument("--stranded", action='store_true', default=False,
-                        help='only count overlaps with matching strand; default=False')
+if args.gc_index is not None and args.engine != 'numpy':
+    arg_parser.error('--gc_index requires --engine numpy')
 
-arg_parser.add_argument("--elem_wise", action='store_true', default=False,
-                        help='perform element-wise overlaps; default=False')
+if args.group_by is not None and (args.engine != 'numpy' or args.checkpoint or args.shard or args.adaptive):
+    arg_parser.error('--group_by requires --engine numpy and cannot be combined with --checkpoint, --shard or --adaptive')
 
-arg_parser.add_argument("--by_hap_block", action='store_true', default=False,
-                        help='perform haplotype-block overlaps; default=False')
+if args.partition and args.engine != 'bedtools':
+    arg_parser.error('--partition applies to the bedtools engine; the numpy engine computes observed overlaps in memory')
 
-args = arg_parser.parse_args()
+if args.resume and args.checkpoint is None:
+    arg_parser.error('--resume requires --checkpoint')
 
 # save parameters
-ANNOTATION_FILENAME = args.region_file_1
+ANNOTATION_FILENAMES = ([args.region_file_1] if args.region_file_1 else []) + args.annotation
+MANIFEST_FILENAME = args.manifest
 TEST_FILENAME = args.region_file_2
 COUNT_FILENAME = args.print_counts_to
+CHECKPOINT_FILENAME = args.checkpoint
+RESUME = args.resume
+SEED = args.seed
 ITERATIONS = args.iters
 SPECIES = args.species
+CHROM_SIZES = args.chrom_sizes
 ELEMENT = args.elem_wise
 HAPBLOCK = args.by_hap_block
+GROUP_BY = args.group_by
+PARTITION = args.partition
+CHUNK_BP = args.chunk_bp
 STRAND = args.stranded
 CUSTOM_BLIST = args.blacklist
+ENGINE = args.engine
+BATCH_SIZE = max(1, args.batch_size)
+CACHE_DIR = args.cache_dir
+GC_INDEX_DIR = args.gc_index
+GC_BINS = args.gc_bins
+PROFILE_FILENAME = args.profile
+ADAPTIVE = args.adaptive
+ALPHA = args.alpha
+BC_H = args.bc_h
+ROUND_SIZE = max(1, args.round_size)
+
+# a shard runs a disjoint, deterministically seeded slice of the iterations
+SHARD = args.shard
+FIRST_ITER, LAST_ITER = 0, ITERATIONS
+if SHARD is not None:
+    try:
+        shard, num_shards = map(int, SHARD.split('/'))
+    except ValueError:
+        arg_parser.error('--shard must look like i/N')
+    if not 1 <= shard <= num_shards:
+        arg_parser.error('--shard i/N needs 1 <= i <= N')
+    if SEED is None or COUNT_FILENAME is None or ADAPTIVE:
+        arg_parser.error('--shard requires --seed and --print_counts_to, and cannot be --adaptive')
+    FIRST_ITER, LAST_ITER = (shard - 1) * ITERATIONS // num_shards, shard * ITERATIONS // num_shards
 
 # calculate the number of threads
 if args.num_threads:
@@ -85,18 +159,32 @@ else:
 # if running on slurm, set tmp to runtime dir
 set_tempdir(os.getenv('ACCRE_RUNTIME_DIR', get_tempdir()))
 
+# genome and memory-mapped test index, allowed segments and GC index, opened once per worker by initWorker
+GENOME = None
+TEST_INDEX = None
+ALLOWED = None
+GC_INDEX = None
+
+# directory and arrays of the prepared annotation a worker currently has mapped
+ANNOTATION = (None, None)
+
+# run profile collected in the parent when --profile is set
+RUN_PROFILE = None
+
 
 ###
 #   functions
 ###
-def loadConstants(species, custom=''):
-    if custom is not None:
+def loadConstants(species, custom='', chrom_sizes=None):
+    # a chromosome sizes file has no default blacklist
+    if custom is not None or chrom_sizes is not None:
         return custom
-    return {'hg19': "/dors/capra_lab/users/bentonml/data/dna/hg19/hg19_blacklist_gap.bed",
-            'hg38': "/dors/capra_lab/users/bentonml/data/dna/hg38/hg38_blacklist_gap.bed",
-            'mm10': "/dors/capra_lab/users/bentonml/data/dna/mm10/mm10_blacklist_gap.bed",
-            'dm3' : "/dors/capra_lab/data/dna/fly/dm3-blacklist.bed"
-            }[species]
+    return DEFAULT_BLACKLISTS.get(species)
+
+
+def genomeArgs(species, chrom_sizes=None):
+    # bedtools takes a chromosome sizes file as g and a named assembly as genome
+    return {'g': chrom_sizes} if chrom_sizes is not None else {'genome': species}
 
 
 def calculateObserved(annotation, test, elementwise, hapblock, strand):
@@ -116,86 +204,343 @@ def calculateObserved(annotation, test, elementwise, hapblock, strand):
     return obs_sum
 
 
-def calculateExpected(annotation, test, elementwise, hapblock, species, custom, strand, iters):
-    BLACKLIST = loadConstants(species, custom)
-    exp_sum = 0
+def calculateObservedPartition(elementwise, hapblock, strand, partition):
+    # observed count of one (annotation, test) partition; for hap blocks the set of labels
+    # seen, so that a block overlapped in several partitions is counted once
+    annotation_fn, test_fn = partition
+    labels = hapblock and not elementwise
+    if os.path.getsize(annotation_fn) == 0 or os.path.getsize(test_fn) == 0:
+        return set() if labels else 0
+
+    annotation, test = BedTool(annotation_fn), BedTool(test_fn)
+    if labels:
+        return set(x[-2] for x in annotation.intersect(test, wo=True, s=strand))
+    return calculateObserved(annotation, test, elementwise, hapblock, strand)
 
+
+def calculateObservedPartitioned(pool, annotation_fn, test_fn, elementwise, hapblock, strand, chunk_bp):
+    # partitions share no interval, so bp sums and element counts add up and label sets union exactly
+    outdir = tempfile.mkdtemp(prefix='partitions.', dir=get_tempdir())
     try:
-        rand_file = annotation.shuffle(genome=species, excl=BLACKLIST, chrom=True, noOverlapping=True)
+        partitions = partition_beds([annotation_fn, test_fn], outdir, chunk_bp)
+        results = list(pool.imap_unordered(partial(calculateObservedPartition, elementwise, hapblock, strand), partitions))
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
 
-        if elementwise:
-            exp_sum = rand_file.intersect(test, u=True, s=strand).count()
-        else:
-            exp_intersect = rand_file.intersect(test, s=strand, wo=True)
+    if hapblock and not elementwise:
+        return len(set().union(*results))
+    return sum(results)
+
+
+def calculateExpected(annotation, test, elementwise, hapblock, species, chrom_sizes, custom, strand, seed, iters):
+    BLACKLIST = loadConstants(species, custom, chrom_sizes)
+    exp_sum = 0
+
+    # bedtools takes a plain integer seed
+    shuffle_args = {} if seed is None else {'seed': int(numpy_engine.iteration_seed(seed, iters).generate_state(1)[0])}
+    # pybedtools passes None on as '-excl None', so leave excl out without a blacklist
+    if BLACKLIST is not None:
+        shuffle_args['excl'] = BLACKLIST
+
+    try:
+        with timed('shuffle'):
+            rand_file = annotation.shuffle(chrom=True, noOverlapping=True, **genomeArgs(species, chrom_sizes), **shuffle_args)
 
-            if hapblock:
-                exp_sum = len(set(x[-2] for x in exp_intersect))
+        with timed('intersect'):
+            if elementwise:
+                exp_intersect = rand_file.intersect(test, u=True, s=strand)
+                exp_sum = exp_intersect.count()
             else:
-                for line in exp_intersect:
-                    exp_sum += int(line[-1])
-    except BEDToolsError:
+                exp_intersect = rand_file.intersect(test, s=strand, wo=True)
+
+                if hapblock:
+                    exp_sum = len(set(x[-2] for x in exp_intersect))
+                else:
+                    for line in exp_intersect:
+                        exp_sum += int(line[-1])
+        addTempBytes(rand_file.fn, exp_intersect.fn)
+    except BEDToolsError as e:
+        addError('iteration {}: {}'.format(iters, e))
         exp_sum = -999
 
     return exp_sum
 
 
-def calculateEmpiricalP(obs, exp_sum_list):
-    mu = np.mean(exp_sum_list)
-    sigma = np.std(exp_sum_list)
-    dist_from_mu = [exp - mu for exp in exp_sum_list]
-    p_sum = sum(1 for exp_dist in dist_from_mu if abs(exp_dist) >= abs(obs - mu))
+def loadEngineData(test_fn, species, chrom_sizes, custom, strand, cache_dir, group_by=None):
+    genome = numpy_engine.load_genome(species, chrom_sizes)
+
+    allowed_dir = numpy_engine.allowed_segments_cache(genome, loadConstants(species, custom, chrom_sizes), cache_dir)
+    test = read_bed(test_fn, keep_fields=group_by is not None)
+    groups = column_values(test, group_by) if group_by is not None else None
+    index = numpy_engine.build_index(test, genome, strand, groups)
+
+    return genome, allowed_dir, index
+
+
+def saveTestIndex(index):
+    # the test set never changes, so workers map one on-disk copy rather than unpickling it per task
+    return numpy_engine.save_arrays(index, tempfile.mkdtemp(prefix='test_index.', dir=get_tempdir()))
+
+
+def saveAnnotation(annotation):
+    # mapped by the workers, as the test index, so that block tasks only carry its path
+    return numpy_engine.save_arrays(annotation, tempfile.mkdtemp(prefix='annotation.', dir=get_tempdir()))
+
+
+def initWorker(genome, index_dir, allowed_dir, gc_dir=None):
+    global GENOME, TEST_INDEX, ALLOWED, GC_INDEX
+    GENOME = genome
+    TEST_INDEX = numpy_engine.load_arrays(index_dir)
+    ALLOWED = numpy_engine.load_arrays(allowed_dir)
+    GC_INDEX = load_gc_index(gc_dir) if gc_dir is not None else None
 
-    # add pseudocount only to avoid divide by 0 errors
-    if mu == 0:
-        fold_change = (obs + 1.0) / (mu + 1.0)
+
+def mappedAnnotation(annotation_dir):
+    global ANNOTATION
+    if ANNOTATION[0] != annotation_dir:
+        ANNOTATION = (annotation_dir, numpy_engine.load_arrays(annotation_dir))
+    return ANNOTATION[1]
+
+
+def calculateExpectedNumpy(annotation_dir, elementwise, hapblock, strand, seed, block):
+    # simulate a block of iterations at once from the worker's mapped ALLOWED segments and
+    # TEST_INDEX; returns one count (or one row of group counts) per iteration in the block
+    annotation = mappedAnnotation(annotation_dir)
+
+    try:
+        with timed('shuffle'):
+            rand_starts = numpy_engine.shuffle_block(annotation, ALLOWED, seed, block, gc=GC_INDEX)
+        with timed('intersect'):
+            exp_sums = numpy_engine.count_placed(TEST_INDEX, annotation, GENOME, rand_starts, elementwise, hapblock, strand)
+    except numpy_engine.ShuffleError as e:
+        addError('iterations {}-{}: {}'.format(block[0], block[1] - 1, e))
+        exp_sums = numpy_engine.failed_counts(TEST_INDEX, block[1] - block[0])
+
+    return exp_sums
+
+
+def checkpointHeader(annotation_fn):
+    # the run settings a checkpoint's counts depend on; --resume refuses a file with another header
+    mode = 'elem_wise' if ELEMENT else 'hap_block' if HAPBLOCK else 'bp'
+    absolute = lambda fn: os.path.abspath(fn) if fn is not None else None
+    genome = absolute(CHROM_SIZES) if CHROM_SIZES is not None else SPECIES
+    gc = '{}:{}'.format(absolute(GC_INDEX_DIR), GC_BINS) if GC_INDEX_DIR is not None else None
+    return ('#seed={}\ttest={}\tannotation={}\tmode={}{}\tgenome={}\tblacklist={}\tengine={}\tgc_index={}\n'
+            .format(SEED, absolute(TEST_FILENAME), absolute(annotation_fn), mode, ',stranded' if STRAND else '',
+                    genome, absolute(loadConstants(SPECIES, CUSTOM_BLIST, CHROM_SIZES)), ENGINE, gc))
+
+
+def readCheckpoint(filename):
+    # header line and iteration -> count; a line cut short by a killed job has no newline and is dropped
+    header, done = None, {}
+    with open(filename, 'r') as infile:
+        for line in infile:
+            if line.startswith('#'):
+                header = line
+                continue
+            fields = line.split('\t')
+            if line.endswith('\n') and len(fields) == 2:
+                done[int(fields[0])] = int(fields[1])
+    return header, done
+
+
+def checkResume(checkpoint_fn, annotation_fn):
+    if os.path.exists(checkpoint_fn) and readCheckpoint(checkpoint_fn)[0] != checkpointHeader(annotation_fn):
+        arg_parser.error('cannot --resume {}: it was written with a different seed, test file, annotation, '
+                         'overlap mode, genome, blacklist, engine or GC index'.format(checkpoint_fn))
+
+
+def openCheckpoint(filename, resume, header):
+    done = readCheckpoint(filename)[1] if resume and os.path.exists(filename) else {}
+
+    # rewrite the valid records so later appends never follow a partial line
+    checkpoint = open(filename, 'w')
+    checkpoint.write(header + ''.join('{}\t{}\n'.format(i, done[i]) for i in sorted(done)))
+    checkpoint.flush()
+
+    return checkpoint, done
+
+
+def iterationBlocks(iterations, size):
+    # split sorted iterations into contiguous (first, last) blocks of at most size
+    blocks = []
+    for i in iterations:
+        if blocks and blocks[-1][1] == i and i - blocks[-1][0] < size:
+            blocks[-1] = (blocks[-1][0], i + 1)
+        else:
+            blocks.append((i, i + 1))
+    return blocks
+
+
+def runTask(partial_calcExp, profile, task):
+    if profile:
+        return (task,) + profiledTask(partial_calcExp, task)
+    return task, partial_calcExp(task), None
+
+
+def mapSimulations(pool, partial_calcExp, iterations, annotation_fn, block_size):
+    # yields the (iteration, count) pairs of each task as soon as it finishes;
+    # numpy tasks are blocks of up to block_size iterations, bedtools tasks are single iterations
+    run = partial(runTask, partial_calcExp, RUN_PROFILE is not None)
+    if ENGINE == 'numpy':
+        for block, counts, stats in pool.imap_unordered(run, iterationBlocks(iterations, block_size)):
+            if stats is not None:
+                addTask(RUN_PROFILE, annotation_fn, block[1] - block[0], stats)
+            yield list(zip(range(*block), np.asarray(counts).astype(int).tolist()))
     else:
-        fold_change = obs / mu
+        chunksize = max(1, len(iterations) // (num_threads * 4))
+        for i, count, stats in pool.imap_unordered(run, iterations, chunksize):
+            if stats is not None:
+                addTask(RUN_PROFILE, annotation_fn, 1, stats)
+            yield [(i, count)]
+
+
+def runSimulations(pool, annotation_fn, test, genome, checkpoint_fn=None):
+    # observed and expected counts for one annotation against the shared test set (index or BedTool)
+    if ENGINE == 'numpy':
+        with timed('load_annotation'):
+            annotation = numpy_engine.prepare_annotation(read_bed(annotation_fn), genome)
+            if GC_INDEX_DIR is not None:
+                annotation = match_gc(annotation, load_gc_index(GC_INDEX_DIR), genome, GC_BINS)
+        with timed('observed'):
+            obs_sum = numpy_engine.count_placed(test, annotation, genome, annotation['start'], ELEMENT, HAPBLOCK, STRAND)
+        annotation_dir = saveAnnotation(annotation)
+        addTempBytes(*(os.path.join(annotation_dir, f) for f in os.listdir(annotation_dir)))
+        partial_calcExp = partial(calculateExpectedNumpy, annotation_dir, ELEMENT, HAPBLOCK, STRAND, SEED)
+        block_size = numpy_engine.block_rows(len(annotation['chrom']), BATCH_SIZE)
+    else:
+        annotation = BedTool(annotation_fn)
+        with timed('observed'):
+            if PARTITION:
+                obs_sum = calculateObservedPartitioned(pool, annotation_fn, TEST_FILENAME, ELEMENT, HAPBLOCK, STRAND, CHUNK_BP)
+            else:
+                obs_sum = calculateObserved(annotation, test, ELEMENT, HAPBLOCK, STRAND)
+        partial_calcExp = partial(calculateExpected, annotation, test, ELEMENT, HAPBLOCK, SPECIES, CHROM_SIZES, CUSTOM_BLIST, STRAND, SEED)
+        block_size = 1
+        annotation_dir = None
+
+    checkpoint, done = openCheckpoint(checkpoint_fn, RESUME, checkpointHeader(annotation_fn)) if checkpoint_fn else (None, {})
+
+    # adaptive runs check the stopping rule after every round
+    round_size = ROUND_SIZE if ADAPTIVE else max(LAST_ITER - FIRST_ITER, 1)
+    exp_sum_list = []
+    begin = time.perf_counter()
+    for first in range(FIRST_ITER, LAST_ITER, round_size):
+        last = min(first + round_size, LAST_ITER)
+
+        for results in mapSimulations(pool, partial_calcExp, [i for i in range(first, last) if i not in done], annotation_fn,
+                                      block_size):
+            done.update(results)
+            if checkpoint is not None:
+                checkpoint.write(''.join('{}\t{}\n'.format(i, count) for i, count in results))
+                checkpoint.flush()
+
+        exp_sum_list = [done[i] for i in range(FIRST_ITER, last)]
+        if ADAPTIVE and isResolved(obs_sum, [x for x in exp_sum_list if x >= 0], ALPHA, BC_H):
+            break
 
-    p_val = (p_sum + 1.0) / (len(exp_sum_list) + 1.0)
+    if checkpoint is not None:
+        checkpoint.close()
+    if annotation_dir is not None:
+        shutil.rmtree(annotation_dir, ignore_errors=True)
 
-    return "%d\t%.3f\t%.3f\t%.3f\t%.3f" % (obs, mu, sigma, fold_change, p_val)
+    if RUN_PROFILE is not None:
+        addAnnotationResult(RUN_PROFILE, annotation_fn, time.perf_counter() - begin, num_threads, exp_sum_list)
+
+    return obs_sum, exp_sum_list
+
+
+def isResolved(obs, exp_sum_list, alpha, h):
+    # besag-clifford sequential rule: after h extreme simulations the p-value is ~ h / n, so
+    # stop as soon as that estimate is already above alpha
+    if len(exp_sum_list) == 0:
+        return False
+    num_extreme = countExtreme(obs, exp_sum_list)
+    return num_extreme >= h and num_extreme / len(exp_sum_list) > alpha
 
 
 ###
 #   main
 ###
 def main(argv):
-    # print header
-    print('python {:s} {:s}'.format(' '.join(sys.argv), str(datetime.datetime.now())[:20]))
-    print('Observed\tExpected\tStdDev\tFoldChange\tp-value')
+    annotation_fns = ANNOTATION_FILENAMES + (readManifest(MANIFEST_FILENAME) if MANIFEST_FILENAME else [])
+    if not annotation_fns:
+        arg_parser.error('no bed file 1 given; pass region_file_1, --annotation or --manifest')
+    multiple = len(annotation_fns) > 1
 
-    # run initial intersection and save
-    obs_sum = calculateObserved(BedTool(ANNOTATION_FILENAME), BedTool(TEST_FILENAME), ELEMENT, HAPBLOCK, STRAND)
+    # refuse mismatched checkpoints before anything is loaded
+    if RESUME:
+        for annotation_fn in annotation_fns:
+            checkResume(countFilename(CHECKPOINT_FILENAME, annotation_fn, multiple), annotation_fn)
 
-    # create pool and run simulations in parallel
-    pool = Pool(num_threads)
-    partial_calcExp = partial(calculateExpected, BedTool(ANNOTATION_FILENAME), BedTool(TEST_FILENAME), ELEMENT, HAPBLOCK, SPECIES, CUSTOM_BLIST, STRAND)
-    exp_sum_list = pool.map(partial_calcExp, [i for i in range(ITERATIONS)])
+    global RUN_PROFILE
+    if PROFILE_FILENAME is not None:
+        RUN_PROFILE = newRunProfile(command=' '.join(sys.argv), engine=ENGINE, num_threads=num_threads,
+                                    iterations=LAST_ITER - FIRST_ITER, batch_size=BATCH_SIZE)
 
-    # wait for results to finish before calculating p-value
+    # print header
+    print('python {:s} {:s}'.format(' '.join(sys.argv), str(datetime.datetime.now())[:20]))
+    if SHARD is None:
+        print(resultHeader(multiple, GROUP_BY is not None))
+
+    # the test set, blacklist and pool are loaded once and shared by every annotation
+    index_dir = genome = None
+    with timed('setup'):
+        if ENGINE == 'numpy':
+            genome, allowed_dir, test = loadEngineData(TEST_FILENAME, SPECIES, CHROM_SIZES, CUSTOM_BLIST, STRAND, CACHE_DIR, GROUP_BY)
+            index_dir = saveTestIndex(test)
+            addTempBytes(*(os.path.join(index_dir, f) for f in os.listdir(index_dir)))
+            pool = Pool(num_threads, initializer=initWorker, initargs=(genome, index_dir, allowed_dir, GC_INDEX_DIR))
+        else:
+            test = BedTool(TEST_FILENAME)
+            pool = Pool(num_threads)
+
+    failed = 0
+    for annotation_fn in annotation_fns:
+        prefix = annotation_fn + '\t' if multiple else ''
+
+        try:
+            checkpoint_fn = countFilename(CHECKPOINT_FILENAME, annotation_fn, multiple) if CHECKPOINT_FILENAME else None
+            obs_sum, exp_sum_list = runSimulations(pool, annotation_fn, test, genome, checkpoint_fn)
+        except numpy_engine.ShuffleError as e:
+            print(f'{prefix}ERROR: {e}', file=sys.stderr)
+            failed += 1
+            continue
+
+        if SHARD is not None:
+            # partial counts only; merge_enrichment_counts.py checks completion and calculates the p-value
+            writeCounts(countFilename(COUNT_FILENAME, annotation_fn, multiple), obs_sum, exp_sum_list,
+                        shard=(shard, num_shards, FIRST_ITER, LAST_ITER))
+            print(f'{prefix}shard {SHARD} iterations {FIRST_ITER}-{LAST_ITER - 1} not completed: {exp_sum_list.count(-999)}', file=sys.stderr)
+            continue
+
+        count_fn = countFilename(COUNT_FILENAME, annotation_fn, multiple) if COUNT_FILENAME else None
+        if GROUP_BY is None:
+            failed += not reportCounts(prefix, obs_sum, exp_sum_list, count_fn, report_used=ADAPTIVE)
+            continue
+
+        # one row per group of the test set, all from the same shuffles
+        for j, group in enumerate(test['group_names']):
+            group_fn = groupFilename(count_fn, group) if count_fn else None
+            failed += not reportCounts(prefix + group + '\t', int(obs_sum[j]), [row[j] for row in exp_sum_list], group_fn,
+                                       report_used=ADAPTIVE)
+
+    # wait for all workers to finish
     pool.close()
     pool.join()
 
-    # remove iterations that throw bedtools exceptions
-    final_exp_sum_list = [x for x in exp_sum_list if x >= 0]
-    exceptions = exp_sum_list.count(-999)
-
-    # calculate empirical p value
-    if exceptions / ITERATIONS <= .1:
-        print(calculateEmpiricalP(obs_sum, final_exp_sum_list))
-        print(f'iterations not completed: {exceptions}', file=sys.stderr)
-    else:
-        print(f'iterations not completed: {exceptions}\nresulted in nonzero exit status', file=sys.stderr)
-        cleanup()
-        sys.exit(1)
-
-    if COUNT_FILENAME is not None:
-        with open(COUNT_FILENAME, "w") as count_file:
-            count_file.write('{}\n{}\n'.format(obs_sum, '\t'.join(map(str, exp_sum_list))))
+    if index_dir is not None:
+        shutil.rmtree(index_dir, ignore_errors=True)
 
     # clean up any pybedtools tmp files
     cleanup()
 
+    if RUN_PROFILE is not None:
+        writeProfile(PROFILE_FILENAME, RUN_PROFILE)
+
+    if failed:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -2,18 +2,32 @@
 #
 # marylaurenbenton | 2018
 #
-# this script will calculate the jaccard and relative jaccard between SORTED bed files
+# this script will calculate the jaccard and relative jaccard between bed files
 #
 # relative_jaccard = jaccard / max_jaccard
 # where: jaccard = |intersect| / ( |a| + |b| - |intersect| )
 #        max_jaccard = min( |a|, |b| ) / max( |a|, |b| )
 #
-# pass in the names of 2 bed files & optional argument to specify number of significant digits
+# |a| and |b| are the bp covered by each file after merging overlapping intervals;
+# all three lengths come from one sweep over the two merged files, so inputs only
+# need sorting (done here when necessary) rather than three bedtools jaccard calls
+#
+# the sweep itself lives in jaccard_engine.py, shared with enrichment_server.py
+#
+# pass in the names of 2 bed files & optional argument to specify number of significant digits,
+# or any number of bed files with --matrix to compare every pair
 #
 
+import os
 import sys
+import shutil
 import argparse
-import pybedtools
+import tempfile
+import numpy as np
+from multiprocessing import Pool
+
+from bed_partition import partition_beds
+from jaccard_engine import intersection_bp, jaccard, load_merged, partition_lengths
 
 
 ###
@@ -21,40 +35,120 @@ import pybedtools
 ###
 arg_parser = argparse.ArgumentParser(description="Calculate Jaccard and relative Jaccard similarity between bed files.")
 
-arg_parser.add_argument("bed_file_1", help='first BED file; should be sorted')
-arg_parser.add_argument("bed_file_2", help='second BED file; should be sorted')
+arg_parser.add_argument("bed_files", nargs='+', help='two BED files, or two or more with --matrix')
 arg_parser.add_argument('-d', '--decimal', type=int, default=3, help='number of decimal places | default = 3')
+arg_parser.add_argument('-m', '--matrix', type=str, default=None,
+                        help='compare all pairs and write the jaccard matrix here (.npy or tsv); '
+                             'the relative jaccard goes to the same name with .relative before the extension | default = None')
+arg_parser.add_argument('--condensed', action='store_true', default=False,
+                        help='write only the upper triangle (pairs i < j) instead of the square matrix | default = False')
+arg_parser.add_argument('-n', '--num_threads', type=int, help='number of threads | default = SLURM_CPUS_PER_TASK or 1')
+arg_parser.add_argument('--partition', action='store_true', default=False,
+                        help='for a single pair, split both files by chromosome and compare the partitions in parallel, '
+                             'holding one partition in memory at a time | default = False')
+arg_parser.add_argument('--chunk_bp', type=int, default=0,
+                        help='with --partition, also cut chromosomes into chunks of about this many bp at positions no '
+                             'interval spans | default = 0 (whole chromosomes)')
 
 args = arg_parser.parse_args()
 
+if len(args.bed_files) < 2 or (args.matrix is None and len(args.bed_files) != 2):
+    arg_parser.error('pass two BED files, or two or more with --matrix')
+
 # save parameters
-A = args.bed_file_1
-B = args.bed_file_2
+BED_FILES = args.bed_files
 DECIMAL = args.decimal
+MATRIX = args.matrix
+CONDENSED = args.condensed
+PARTITION = args.partition
+CHUNK_BP = args.chunk_bp
+NUM_THREADS = args.num_threads if args.num_threads else int(os.getenv('SLURM_CPUS_PER_TASK', 1))
+
+# merged files shared with the worker processes by init_worker
+MERGED = None
+
+
+###
+#  functions
+###
+def init_worker(merged):
+    global MERGED
+    MERGED = merged
+
+
+def row_intersections(i):
+    return i, [intersection_bp(MERGED[i], MERGED[j]) for j in range(i + 1, len(MERGED))]
+
+
+def jaccard_matrices(merged, num_threads):
+    n = len(merged)
+    result, relative = np.eye(n), np.eye(n)
+
+    with Pool(num_threads, initializer=init_worker, initargs=(merged,)) as pool:
+        for i, intersections in pool.imap_unordered(row_intersections, range(n - 1)):
+            for j, intersection in enumerate(intersections, start=i + 1):
+                pair = jaccard(intersection, merged[i]['length'], merged[j]['length'])
+                result[i, j], relative[i, j] = result[j, i], relative[j, i] = pair
+
+    return result, relative
+
+
+def partitioned_jaccard(filenames, num_threads, chunk_bp):
+    outdir = tempfile.mkdtemp(prefix='jaccard_partitions.')
+    try:
+        partitions = partition_beds(filenames, outdir, chunk_bp)
+        with Pool(num_threads) as pool:
+            sums = np.array(list(pool.imap_unordered(partition_lengths, partitions)), dtype=np.int64).reshape(-1, 3)
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+    intersection, a_len, b_len = (int(x) for x in sums.sum(axis=0))
+    return jaccard(intersection, a_len, b_len)
+
+
+def write_matrix(filename, names, matrix, condensed, decimal):
+    rows, cols = np.triu_indices(len(names), k=1)
+
+    if filename.endswith('.npy'):
+        np.save(filename, matrix[rows, cols] if condensed else matrix)
+        return
+
+    with open(filename, 'w') as outfile:
+        if condensed:
+            for i, j in zip(rows, cols):
+                outfile.write('{}\t{}\t{:.{}f}\n'.format(names[i], names[j], matrix[i, j], decimal))
+        else:
+            outfile.write('\t' + '\t'.join(names) + '\n')
+            for name, row in zip(names, matrix):
+                outfile.write(name + '\t' + '\t'.join('{:.{}f}'.format(x, decimal) for x in row) + '\n')
 
 
 ###
 #  main
 ###
 def main(argv):
-    # create bedtools objects
-    a = pybedtools.BedTool(A).sort()
-    b = pybedtools.BedTool(B).sort()
+    if PARTITION and MATRIX is None:
+        result, relative = partitioned_jaccard(BED_FILES, NUM_THREADS, CHUNK_BP)
+        print('Jaccard: {}'.format(round(result, DECIMAL)))
+        print('Relative Jaccard: {}'.format(round(relative, DECIMAL)))
+        return
 
-    # calculate jaccard similarity
-    result = a.jaccard(b)
+    codes = {}
+    merged = [load_merged(filename, codes) for filename in BED_FILES]
 
-    # calculate len of A and B
-    a_self = a.jaccard(a)['intersection']
-    b_self = b.jaccard(b)['intersection']
+    if MATRIX is not None:
+        result, relative = jaccard_matrices(merged, NUM_THREADS)
+        root, ext = os.path.splitext(MATRIX)
+        write_matrix(MATRIX, BED_FILES, result, CONDENSED, DECIMAL)
+        write_matrix(root + '.relative' + ext, BED_FILES, relative, CONDENSED, DECIMAL)
+        return
 
-    # calculate the relative jaccard
-    relative = result['jaccard'] / (min(a_self, b_self) / max(a_self, b_self))
+    a, b = merged
+    result, relative = jaccard(intersection_bp(a, b), a['length'], b['length'])
 
-    print('Jaccard: {}'.format(round(result['jaccard'], DECIMAL)))
+    print('Jaccard: {}'.format(round(result, DECIMAL)))
     print('Relative Jaccard: {}'.format(round(relative, DECIMAL)))
 
 
 if __name__ == "__main__":
     main(sys.argv[1:])
-
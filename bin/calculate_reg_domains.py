@@ -3,107 +3,171 @@
 #   conda env | enh_gain-loss
 #   created   | 2018.06.25
 #   updated   | 2018.06.26
+#             | 2026.10.18
 #
 #   this script will calculate a 'basal plus extension' regulatory domain using
 #   the definitions from GREAT and save the resulting bed file
 ###
 
 
+import os
 import sys
+import itertools
 import pybedtools
 import argparse
-import pandas as pd
 import numpy  as np
+from functools import partial
+from multiprocessing import Pool
+
+from bed_reader import read_bed
+from numpy_engine import chrom_sizes
 
 
 ###
 #  variables
 ###
+def kb_values(text):
+    # comma-separated values and inclusive start:stop[:step] ranges for parameter sweeps,
+    # in one token so the option never swallows the gene file (e.g. 100,200,500:1000:100)
+    values = []
+    for item in text.split(','):
+        parts = [int(x) for x in item.split(':')]
+        if len(parts) == 1:
+            values += parts
+            continue
+        start, stop, step = parts if len(parts) == 3 else parts + [1]
+        values += list(range(start, stop + 1, step))
+    return values
+
+
 arg_parser = argparse.ArgumentParser(description="Create a BED file with the regulatory domains for a set of genes.")
 
 arg_parser.add_argument('gene_file',   help='BED file of genes; should be sorted')
 arg_parser.add_argument('-a', '--algorithm',  type=str, default='great', choices=['great', 'window'], help='regulatory domain definition; default=great')
 arg_parser.add_argument('-s', '--species',    type=str, default='hg19', choices=['hg19', 'hg38'], help='species and assembly; default=hg19')
-arg_parser.add_argument('-u', '--upstream',   type=int, default=5, help='basal upstream extension in kb; default=5')
-arg_parser.add_argument('-d', '--downstream', type=int, default=1, help='basal downstream extension in kb; default=1')
-arg_parser.add_argument('-e', '--extension',  type=int, default=1000, help='maximum extension in kb; default=1000')
+arg_parser.add_argument('-g', '--chrom_sizes', type=str, default=None, help='chromosome sizes file used instead of --species; default=None')
+arg_parser.add_argument('-u', '--upstream',   type=kb_values, default=[5], help='basal upstream extension in kb, or a comma-separated sweep; default=5')
+arg_parser.add_argument('-d', '--downstream', type=kb_values, default=[1], help='basal downstream extension in kb, or a comma-separated sweep; default=1')
+arg_parser.add_argument('-e', '--extension',  type=kb_values, default=[1000], help='maximum extension in kb, or a comma-separated sweep; default=1000')
 arg_parser.add_argument('-o', '--outfile',    type=str, default='result.bed', help='output file name; default=result.bed')
+arg_parser.add_argument('-n', '--num_threads', type=int, help='parallel parameter combinations; default=SLURM_CPUS_PER_TASK or 1')
+arg_parser.add_argument('--single_file', action='store_true', default=False,
+                        help='write every parameter combination to outfile, tagged in a 6th column; default=False')
 
 
 args = arg_parser.parse_args()
 
-# save parameters
-UP_EXTENSION = args.upstream   * 1000
-DN_EXTENSION = args.downstream * 1000
-MAX_EXTENSION = args.extension * 1000
+# save parameters; several -u/-d/-e values (like 100,200 or 100:1000:100) sweep every combination
+UP_EXTENSIONS = [x * 1000 for x in args.upstream]
+DN_EXTENSIONS = [x * 1000 for x in args.downstream]
+MAX_EXTENSIONS = [x * 1000 for x in args.extension]
 SPECIES = args.species
+CHROM_SIZES = args.chrom_sizes
 GENE_FILE = args.gene_file
 ALGORITHM = args.algorithm
 OUTFILE = args.outfile
+SINGLE_FILE = args.single_file
+NUM_THREADS = args.num_threads if args.num_threads else int(os.getenv('SLURM_CPUS_PER_TASK', 1))
 
 
 ###
 #  functions
 ###
-# modified from https://stackoverflow.com/questions/323750/how-to-access-previous-next-element-while-for-looping
-def neighbors(iterable):
-    itr = iter(iterable)
-    prev_item = None
-    curr_item = next(itr)
-    for next_item in itr:
-        yield (prev_item, curr_item, next_item)
-        prev_item, curr_item = curr_item, next_item
-    yield (prev_item, curr_item, None)
+def read_genes(gene_file):
+    genes = read_bed(gene_file)
+    return genes['chrom'], genes['start'], genes['end'], genes['name'], genes['strand']
+
+
+def gene_chrom_sizes(genes, species, sizes_fn=None):
+    sizes = chrom_sizes(species, sizes_fn)
+    return np.array([sizes[c] for c in genes[0]], dtype=np.int64)
+
 
+def basal_plus_extension(genes, chr_size, up_extension, dn_extension, max_extension):
+    # neighbors are the previous/next gene in file order on the same chromosome, so genes must be sorted;
+    # chr_size holds the size of each gene's chromosome
+    chrom, start, end, name, strand = genes
+    plus = strand == '+'
+    up = np.where(plus, up_extension, dn_extension)
+    dn = np.where(plus, dn_extension, up_extension)
 
-def basal_plus_extension(genes, species, up_extension, dn_extension, max_extension):
-    chrom_sizes = pybedtools.helpers.chromsizes(species)
-    expanded_genes = genes.slop(genome=species, l=(up_extension), r=(dn_extension), s=True)
-    result = ''
+    # basal domain: strand-aware slop clipped to the chromosome, as genes.slop(s=True)
+    basal_start = np.maximum(0, start - up)
+    basal_end = np.minimum(chr_size, end + dn)
+    tss = basal_start + up
 
-    for p, c, n in neighbors(expanded_genes):
-        chr_size = chrom_sizes[c.chrom][1]
-        curr_tss = c.start + up_extension if c.strand == '+' else c.start + dn_extension
+    tmp_start = np.minimum(basal_start, np.maximum(0, tss - max_extension))
+    tmp_end = np.maximum(basal_end, np.minimum(chr_size, tss + max_extension))
 
-        tmp_start = max(0, curr_tss - max_extension)
-        basal_start = c.start
-        tmp_start = min(basal_start, tmp_start)
+    # extension stops at the basal domain of the neighboring genes
+    same_chrom = chrom[1:] == chrom[:-1]
+    prev_end = (tss + dn)[:-1]
+    next_start = (tss - up)[1:]
+    tmp_start[1:] = np.where(same_chrom, np.minimum(basal_start[1:], np.maximum(prev_end, tmp_start[1:])), tmp_start[1:])
+    tmp_end[:-1] = np.where(same_chrom, np.maximum(basal_end[:-1], np.minimum(next_start, tmp_end[:-1])), tmp_end[:-1])
 
-        if (p is not None) and (p.chrom == c.chrom):
-            prev_tss = p.start + up_extension if p.strand == '+' else p.start + dn_extension
-            prev_end = prev_tss + dn_extension if p.strand == '+' else prev_tss + up_extension
-            tmp_start = min(basal_start, max(prev_end, tmp_start))
+    return chrom, tmp_start, tmp_end, name, strand
 
-        tmp_end = min(chr_size, curr_tss + max_extension);
-        basal_end = c.end;
-        tmp_end = max(basal_end, tmp_end)
 
-        if (n is not None) and (c.chrom == n.chrom):
-            next_tss = n.start + up_extension if n.strand == '+' else n.start + dn_extension
-            next_start = next_tss - up_extension if n.strand == '+' else next_tss - dn_extension
-            tmp_end = max(basal_end, min(next_start, tmp_end))
+def write_domains(domains, out, chunk_size=100000, tag=None):
+    # written in chunks so memory stays flat for genome-wide gene sets
+    line = '{}\t{}\t{}\t{}\t{}\t' + tag + '\n' if tag else '{}\t{}\t{}\t{}\t{}\n'
+    for i in range(0, len(domains[0]), chunk_size):
+        rows = zip(*(column[i:i + chunk_size] for column in domains))
+        out.write(''.join(line.format(*row) for row in rows))
 
-        result += '\n' + c.chrom + ' ' + str(tmp_start) + ' ' + str(tmp_end) + ' ' + c.name + ' ' + c.strand
 
-    return result
+def combination_tag(up_extension, dn_extension, max_extension):
+    return 'u{}_d{}_e{}'.format(up_extension // 1000, dn_extension // 1000, max_extension // 1000)
 
 
-def gene_window(genes, species, extension):
-    return genes.slop(genome=species, b=extension)
+def combination_outfile(outfile, combination):
+    root, ext = os.path.splitext(outfile)
+    return '{}.{}{}'.format(root, combination_tag(*combination), ext)
+
+
+def great_combination(genes, chr_size, outfile, combination):
+    # one sweep point; returns the domains when they are collected into a single file
+    domains = basal_plus_extension(genes, chr_size, *combination)
+    if outfile is None:
+        return domains
+
+    with open(outfile, 'w') as out:
+        write_domains(domains, out)
+    return outfile
+
+
+def gene_window(genes, species, extension, sizes_fn=None):
+    return genes.slop(b=extension, **({'g': sizes_fn} if sizes_fn is not None else {'genome': species}))
 
 
 ###
 #  main
 ###
 def main(argv):
-    # save variables
-    genes = pybedtools.BedTool(GENE_FILE)
-
     if ALGORITHM == 'great':
-        pybedtools.BedTool(basal_plus_extension(genes, SPECIES, UP_EXTENSION, DN_EXTENSION, MAX_EXTENSION),
-                           from_string=True).saveas(OUTFILE)
+        combinations = list(itertools.product(UP_EXTENSIONS, DN_EXTENSIONS, MAX_EXTENSIONS))
+        sweep = len(combinations) > 1
+
+        # genes and chromosome sizes are parsed once for every combination
+        genes = read_genes(GENE_FILE)
+        chr_size = gene_chrom_sizes(genes, SPECIES, CHROM_SIZES)
+
+        if not sweep:
+            great_combination(genes, chr_size, OUTFILE, combinations[0])
+        elif SINGLE_FILE:
+            with Pool(NUM_THREADS) as pool, open(OUTFILE, 'w') as out:
+                for combination, domains in zip(combinations, pool.imap(partial(great_combination, genes, chr_size, None), combinations)):
+                    write_domains(domains, out, tag=combination_tag(*combination))
+        else:
+            outfiles = [combination_outfile(OUTFILE, c) for c in combinations]
+            with Pool(NUM_THREADS) as pool:
+                pool.starmap(partial(great_combination, genes, chr_size), zip(outfiles, combinations))
     elif ALGORITHM == 'window':
-        gene_window(genes, SPECIES, MAX_EXTENSION).saveas(OUTFILE)
+        genes = pybedtools.BedTool(GENE_FILE)
+        for max_extension in MAX_EXTENSIONS:
+            outfile = OUTFILE if len(MAX_EXTENSIONS) == 1 else combination_outfile(OUTFILE, (0, 0, max_extension))
+            gene_window(genes, SPECIES, max_extension, CHROM_SIZES).saveas(outfile)
     else:
         print('Invalid algorithm option.')
 
@@ -5,52 +5,85 @@
 # Calculate empirical p-value to compare enrichment between simulations
 # Assumes comparison of region from the shuffled files
 #
+# Count files may be text or .npy (see enrichment_counts.py); with --matrix,
+# every pair of count files is compared and the p-values are written as a matrix
+#
 
 import sys
 import argparse
 import datetime
 import numpy as np
 
+from enrichment_counts import readCounts
+
 ###
 #   arguments
 ###
 arg_parser = argparse.ArgumentParser(description="Compare enrichment between count files.")
 
-arg_parser.add_argument("count_file_1", help="count file for region_file_1")
-arg_parser.add_argument("count_file_2", help="count file for region_file_2")
+arg_parser.add_argument("count_files", nargs='+', help="count files for region_file_1, region_file_2, ...")
+
+arg_parser.add_argument("--matrix", type=str, default=None,
+                        help="compare all pairs of count files and write the p-value matrix here (.npy or tsv); default=None")
 
 args = arg_parser.parse_args()
 
+if len(args.count_files) < 2 or (args.matrix is None and len(args.count_files) != 2):
+    arg_parser.error('pass two count files, or two or more with --matrix')
+
 # save parameters
-COUNTS_A_FILENAME = args.count_file_1
-COUNTS_B_FILENAME = args.count_file_2
+COUNT_FILENAMES = args.count_files
+MATRIX_FILENAME = args.matrix
+
+# iterations compared at once, which bounds the temporary arrays of each comparison
+CHUNK_SIZE = 1 << 16
 
 
 ###
 #   functions 
 ###
-def read_counts(filename):
-    with open(filename, 'r') as infile:
-        obs = int(infile.readline().strip())
-
-        # expects data in counts format: [ obs ] [ exp \t exp \t ... ]
-        exp_list = infile.readline().strip().split('\t')
+def calculate_fc_distribution(obs, exp_list):
+    return (obs + 1.0) / (np.asarray(exp_list) + 1.0)
 
-    return obs, np.array(exp_list, dtype=int)
 
-
-def calculate_fc_distribution(obs, exp_list):
-    return np.array([(obs + 1.0) / (exp + 1.0) for exp in exp_list])
+def calculate_obs_fc(obs, exp_list):
+    return (obs + 1.0) / (np.mean(exp_list) + 1.0)
 
 
 def calculate_empirical_p(obs_fc_a, fc_list_a, obs_fc_b, fc_list_b):
     delta_final = obs_fc_a - obs_fc_b
-    delta_dist  = [fc_list_a[i] - fc_list_b[i] for i in range(len(fc_list_a))]
 
-    # sum number of differences >= to observed difference
-    p_sum = sum(1 for delta in delta_dist if abs(delta) >= abs(delta_final))
+    # iterations are paired, so compare only as many as both files have
+    n = min(len(fc_list_a), len(fc_list_b))
+    # sum number of differences >= to observed difference, a chunk of iterations at a time
+    p_sum = sum(np.count_nonzero(np.abs(fc_list_a[k:min(k + CHUNK_SIZE, n)] - fc_list_b[k:min(k + CHUNK_SIZE, n)]) >= abs(delta_final))
+                for k in range(0, n, CHUNK_SIZE))
+
+    return (p_sum + 1.0) / (n + 1.0)
 
-    return (p_sum + 1.0) / (len(delta_dist) + 1.0)
+
+def calculate_p_matrix(obs_fcs, fc_lists):
+    # every pair compared over the iterations all files have; the lists are sliced, not copied,
+    # so memory stays at the loaded distributions plus one chunk of temporaries
+    n = min(len(fc) for fc in fc_lists)
+    p_matrix = np.ones((len(fc_lists), len(fc_lists)))
+
+    for i in range(len(fc_lists) - 1):
+        for j in range(i + 1, len(fc_lists)):
+            p_matrix[i, j] = p_matrix[j, i] = calculate_empirical_p(obs_fcs[i], fc_lists[i][:n], obs_fcs[j], fc_lists[j][:n])
+
+    return p_matrix
+
+
+def write_p_matrix(filename, names, p_matrix):
+    if filename.endswith('.npy'):
+        np.save(filename, p_matrix)
+        return
+
+    with open(filename, 'w') as outfile:
+        outfile.write('\t' + '\t'.join(names) + '\n')
+        for name, row in zip(names, p_matrix):
+            outfile.write(name + '\t' + '\t'.join('{:.3f}'.format(p) for p in row) + '\n')
 
 
 ###
@@ -59,18 +92,20 @@ def calculate_empirical_p(obs_fc_a, fc_list_a, obs_fc_b, fc_list_b):
 def main(argv):
     # print header
     print('{:s} {:s}'.format(' '.join(sys.argv), str(datetime.datetime.now())[:20]))
-    print('p-value')
-
-    obs_a, exp_list_a = read_counts(COUNTS_A_FILENAME)
-    obs_b, exp_list_b = read_counts(COUNTS_B_FILENAME)
 
-    fc_list_a = calculate_fc_distribution(obs_a, exp_list_a)
-    fc_list_b = calculate_fc_distribution(obs_b, exp_list_b)
+    obs_fcs, fc_lists = [], []
+    for filename in COUNT_FILENAMES:
+        obs, exp_list = readCounts(filename)
+        obs_fcs.append(calculate_obs_fc(obs, exp_list))
+        fc_lists.append(calculate_fc_distribution(obs, exp_list))
 
-    final_obs_a = (obs_a + 1.0) / (np.mean(exp_list_a) + 1.0)
-    final_obs_b = (obs_b + 1.0) / (np.mean(exp_list_b) + 1.0)
+    if MATRIX_FILENAME is not None:
+        write_p_matrix(MATRIX_FILENAME, COUNT_FILENAMES, calculate_p_matrix(obs_fcs, fc_lists))
+        print('p-value matrix: {}'.format(MATRIX_FILENAME))
+        return
 
-    p_val = calculate_empirical_p(final_obs_a, fc_list_a, final_obs_b, fc_list_b)
+    print('p-value')
+    p_val = calculate_empirical_p(obs_fcs[0], fc_lists[0], obs_fcs[1], fc_lists[1])
 
     # print result
     print('{:.3f}'.format(p_val))
@@ -78,4 +113,3 @@ def main(argv):
 
 if __name__ == "__main__":
     main(sys.argv[1:])
-
@@ -0,0 +1,68 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   thin client for enrichment_server.py; takes the same arguments as
+#   calculate_enrichment.py (numpy engine) or calculate_jaccard.py (two files)
+#   and prints the same output, e.g.
+#
+#       python enrichment_client.py enrichment a.bed b.bed -i 1000 --seed 1
+#       python enrichment_client.py jaccard a.bed b.bed -d 4
+#       python enrichment_client.py status
+#
+#   depends on:
+#       a running enrichment_server.py
+###
+
+import os
+import sys
+import json
+import socket
+import argparse
+
+
+DEFAULT_SOCKET = os.getenv('ENRICHMENT_SERVER_SOCKET', os.path.join(os.path.expanduser('~'), '.cache', 'enrichment_server.sock'))
+
+
+###
+#   arguments
+###
+arg_parser = argparse.ArgumentParser(description="Send an enrichment or jaccard job to enrichment_server.py.")
+
+arg_parser.add_argument("tool", choices=['enrichment', 'jaccard', 'status'],
+                        help='calculate_enrichment.py or calculate_jaccard.py job, or the server cache status')
+arg_parser.add_argument("tool_args", nargs=argparse.REMAINDER,
+                        help='arguments passed on to the tool')
+arg_parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET,
+                        help='server socket; default=$ENRICHMENT_SERVER_SOCKET or ~/.cache/enrichment_server.sock')
+
+args = arg_parser.parse_args()
+
+
+###
+#   main
+###
+def main(argv):
+    request = {'tool': args.tool, 'args': args.tool_args, 'cwd': os.getcwd()}
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(args.socket)
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            with sock.makefile('rb') as infile:
+                line = infile.readline()
+    except OSError as e:
+        sys.exit('cannot reach enrichment_server.py at {}: {}'.format(args.socket, e))
+
+    if not line:
+        sys.exit('enrichment_server.py closed the connection')
+
+    response = json.loads(line)
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    sys.exit(response['status'])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,219 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   count files, empirical p-values, result rows and the common enrichment
+#   arguments shared by calculate_enrichment.py, enrichment_server.py and
+#   merge_enrichment_counts.py
+#
+#   count file format: [ obs ] [ exp \t exp \t ... ]
+#   or, for names ending in .npy, one integer array [ obs, exp, exp, ... ]
+#
+#   shard count files also record which shard wrote them, as a first
+#   '#shard=i/N\titerations=first:last' line (in a [name].shard sidecar for .npy)
+###
+
+import os
+import re
+import sys
+import hashlib
+import numpy as np
+
+
+DEFAULT_BLACKLISTS = {'hg19': "/dors/capra_lab/users/bentonml/data/dna/hg19/hg19_blacklist_gap.bed",
+                      'hg38': "/dors/capra_lab/users/bentonml/data/dna/hg38/hg38_blacklist_gap.bed",
+                      'mm10': "/dors/capra_lab/users/bentonml/data/dna/mm10/mm10_blacklist_gap.bed",
+                      'dm3' : "/dors/capra_lab/data/dna/fly/dm3-blacklist.bed"}
+
+
+def addEnrichmentArguments(parser):
+    # arguments of an enrichment run understood by both calculate_enrichment.py and enrichment_server.py
+    parser.add_argument("region_file_1", nargs='?', help='bed file 1 (shuffled); may be left out when --manifest is given')
+    parser.add_argument("region_file_2", help='bed file 2 (not shuffled)')
+
+    parser.add_argument("-a", "--annotation", type=str, action='append', default=[],
+                        help='additional bed file 1, tested against bed file 2 like region_file_1; repeat for several; default=None')
+
+    parser.add_argument("-m", "--manifest", type=str, default=None,
+                        help='file listing additional bed files 1, one path per line; default=None')
+
+    parser.add_argument("-i", "--iters", type=int, default=100,
+                        help='number of simulation iterations; default=100')
+
+    parser.add_argument("-s", "--species", type=str, default='hg19', choices=['hg19', 'hg38', 'mm10', 'dm3', 'sacCer3'],
+                        help='species and assembly; default=hg19')
+
+    parser.add_argument("-g", "--chrom_sizes", type=str, default=None,
+                        help='chromosome sizes file used instead of --species (e.g. a synthetic genome); no default blacklist; default=None')
+
+    parser.add_argument("-b", "--blacklist", type=str, default=None,
+                        help='custom blacklist file; default=None')
+
+    parser.add_argument("-n", "--num_threads", type=int,
+                        help='number of threads; default=SLURM_CPUS_PER_TASK or 1')
+
+    parser.add_argument("--print_counts_to", type=str, default=None,
+                        help="print expected counts to file (binary int array if the name ends in .npy); "
+                             "suffixed with the annotation name when testing several")
+
+    parser.add_argument("--seed", type=int, default=None,
+                        help='seed for reproducible shuffles; each iteration gets its own stream; default=None')
+
+    parser.add_argument("--stranded", action='store_true', default=False,
+                        help='only count overlaps with matching strand; default=False')
+
+    parser.add_argument("--elem_wise", action='store_true', default=False,
+                        help='perform element-wise overlaps; default=False')
+
+    parser.add_argument("--by_hap_block", action='store_true', default=False,
+                        help='perform haplotype-block overlaps; default=False')
+
+    parser.add_argument("--group_by", type=int, default=None,
+                        help='split bed file 2 by the values of this column (1-based) and report one row per group from the '
+                             'same shuffles (numpy engine only; not with --checkpoint, --shard or --adaptive); default=None')
+
+    parser.add_argument("--engine", type=str, default='bedtools', choices=['bedtools', 'numpy'],
+                        help='shuffle/intersect with bedtools or in memory with numpy; default=bedtools')
+
+    parser.add_argument("--batch_size", type=int, default=100,
+                        help='iterations simulated together in one vectorized block, fewer for large annotations (numpy engine only); default=100')
+
+    parser.add_argument("--gc_index", type=str, default=None,
+                        help='GC window index from build_gc_index.py; shuffled intervals are placed in windows of matching GC '
+                             '(anywhere in the genome) instead of on their own chromosome (numpy engine only); default=None')
+
+    parser.add_argument("--gc_bins", type=int, default=20,
+                        help='number of equal-width GC strata used with --gc_index; default=20')
+    return parser
+
+
+def readManifest(filename):
+    with open(filename, 'r') as infile:
+        return [line.strip() for line in infile if line.strip() and not line.startswith('#')]
+
+
+def suffixFilename(filename, suffix):
+    # keep a .npy extension last so the binary format is still recognized
+    root, ext = os.path.splitext(filename)
+    if ext == '.npy':
+        return '{}.{}{}'.format(root, suffix, ext)
+    return '{}.{}'.format(filename, suffix)
+
+
+def countFilename(count_fn, annotation_fn, multiple):
+    if not multiple:
+        return count_fn
+
+    # the basename for readability plus a hash of the full path, so that annotations with the
+    # same name in different directories never share a file
+    digest = hashlib.sha1(os.path.abspath(annotation_fn).encode()).hexdigest()[:8]
+    return suffixFilename(count_fn, '{}.{}'.format(os.path.basename(annotation_fn), digest))
+
+
+def groupFilename(count_fn, group):
+    return suffixFilename(count_fn, re.sub(r'[^\w.-]+', '_', group))
+
+
+def readCounts(filename):
+    if filename.endswith('.npy'):
+        counts = np.load(filename).astype(np.int64)
+        return int(counts[0]), counts[1:]
+
+    with open(filename, 'r') as infile:
+        lines = (line for line in infile if not line.startswith('#'))
+        obs = int(next(lines).strip())
+        # parsed straight into an array rather than one str per iteration
+        exp_line = next(lines, '').strip()
+
+    if not exp_line:
+        return obs, np.zeros(0, dtype=np.int64)
+    return obs, np.fromstring(exp_line, dtype=np.int64, sep='\t')
+
+
+def shardLine(shard):
+    index, num_shards, first, last = shard
+    return '#shard={}/{}\titerations={}:{}\n'.format(index, num_shards, first, last)
+
+
+def readShard(filename):
+    # (i, N, first, last) of the shard that wrote filename, or None for unsharded counts
+    record = filename + '.shard' if filename.endswith('.npy') else filename
+    if not os.path.exists(record):
+        return None
+
+    with open(record, 'r') as infile:
+        line = infile.readline()
+    if not line.startswith('#shard='):
+        return None
+
+    fields = dict(field.split('=', 1) for field in line[1:].strip().split('\t'))
+    index, num_shards = map(int, fields['shard'].split('/'))
+    first, last = map(int, fields['iterations'].split(':'))
+    return index, num_shards, first, last
+
+
+def writeCounts(filename, obs, exp_sum_list, shard=None):
+    # shard, when given, is (i, N, first, last) with iterations first to last - 1
+    header = shardLine(shard) if shard is not None else ''
+
+    if filename.endswith('.npy'):
+        counts = np.concatenate(([obs], np.asarray(exp_sum_list, dtype=np.int64)))
+        # int32 unless a bp count is too large for it
+        fits = counts.size == 0 or np.abs(counts).max() < np.iinfo(np.int32).max
+        np.save(filename, counts.astype(np.int32 if fits else np.int64))
+        if header:
+            with open(filename + '.shard', 'w') as shard_file:
+                shard_file.write(header)
+        return
+
+    with open(filename, "w") as count_file:
+        count_file.write('{}{}\n{}\n'.format(header, obs, '\t'.join(map(str, exp_sum_list))))
+
+
+def countExtreme(obs, exp_sum_list):
+    # number of simulated values at least as far from the simulated mean as observed
+    mu = np.mean(exp_sum_list)
+    return int(np.sum(np.abs(np.asarray(exp_sum_list) - mu) >= abs(obs - mu)))
+
+
+def calculateEmpiricalP(obs, exp_sum_list):
+    mu = np.mean(exp_sum_list)
+    sigma = np.std(exp_sum_list)
+    p_sum = countExtreme(obs, exp_sum_list)
+
+    # add pseudocount only to avoid divide by 0 errors
+    if mu == 0:
+        fold_change = (obs + 1.0) / (mu + 1.0)
+    else:
+        fold_change = obs / mu
+
+    p_val = (p_sum + 1.0) / (len(exp_sum_list) + 1.0)
+
+    return "%d\t%.3f\t%.3f\t%.3f\t%.3f" % (obs, mu, sigma, fold_change, p_val)
+
+
+def resultHeader(multiple, grouped):
+    return '{}{}Observed\tExpected\tStdDev\tFoldChange\tp-value'.format('Annotation\t' if multiple else '',
+                                                                     'Group\t' if grouped else '')
+
+
+def reportCounts(prefix, obs_sum, exp_sum_list, count_fn, out=sys.stdout, err=sys.stderr, report_used=False):
+    # print one result row; False when too many iterations failed
+    # remove iterations that throw bedtools exceptions
+    final_exp_sum_list = [x for x in exp_sum_list if x >= 0]
+    exceptions = exp_sum_list.count(-999)
+
+    # calculate empirical p value
+    if exceptions / max(len(exp_sum_list), 1) <= .1:
+        print(prefix + calculateEmpiricalP(obs_sum, final_exp_sum_list), file=out)
+        print(f'{prefix}iterations not completed: {exceptions}', file=err)
+        if report_used:
+            print(f'{prefix}iterations used: {len(exp_sum_list)}', file=err)
+    else:
+        print(f'{prefix}iterations not completed: {exceptions}\nresulted in nonzero exit status', file=err)
+        return False
+
+    if count_fn is not None:
+        writeCounts(count_fn, obs_sum, exp_sum_list)
+    return True
@@ -0,0 +1,161 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   timing and resource instrumentation for calculate_enrichment.py --profile
+#
+#   every process keeps its own STATS (phase wall/cpu time, temp bytes written,
+#   error messages); workers reset theirs for each task and send them back with
+#   the task's result, and the parent folds them into one run profile that is
+#   written as JSON
+#
+#   cpu time includes the waited-for child processes (the bedtools binaries that
+#   do the shuffle and intersect work of the default engine), and their peak RSS
+#   is reported next to each process's own
+###
+
+import os
+import json
+import time
+import resource
+import numpy as np
+from contextlib import contextmanager
+
+
+# error messages kept per process and per annotation
+MAX_ERRORS = 20
+
+# None unless profiling is on in this process
+STATS = None
+
+
+###
+#   collection (any process)
+###
+def enableProfiling():
+    global STATS
+    STATS = {'phases': {}, 'tmp_bytes': 0, 'errors': []}
+
+
+@contextmanager
+def timed(name):
+    if STATS is None:
+        yield
+        return
+
+    wall, cpu = time.perf_counter(), cpuTime()
+    try:
+        yield
+    finally:
+        phase = STATS['phases'].setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+        phase['wall'] += time.perf_counter() - wall
+        phase['cpu'] += cpuTime() - cpu
+
+
+def addTempBytes(*filenames):
+    if STATS is not None:
+        STATS['tmp_bytes'] += sum(os.path.getsize(f) for f in filenames if f and os.path.isfile(f))
+
+
+def addError(message):
+    if STATS is not None and len(STATS['errors']) < MAX_ERRORS:
+        STATS['errors'].append(message)
+
+
+def cpuTime():
+    # this process plus every child it has waited for
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def peakRssMb():
+    # ru_maxrss is in kB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peakChildRssMb():
+    # largest waited-for child (e.g. a bedtools process)
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def profiledTask(func, task):
+    # run one worker task with fresh STATS; returns its result and the task's profile
+    enableProfiling()
+    wall, cpu = time.perf_counter(), cpuTime()
+    result = func(task)
+
+    return result, dict(STATS, pid=os.getpid(), wall=time.perf_counter() - wall,
+                        cpu=cpuTime() - cpu, peak_rss_mb=peakRssMb(), peak_child_rss_mb=peakChildRssMb())
+
+
+###
+#   run profile (parent)
+###
+def newRunProfile(**settings):
+    enableProfiling()
+    return {'settings': settings, 'annotations': {}, 'workers': {}}
+
+
+def mergePhases(into, phases):
+    for name, phase in phases.items():
+        total = into.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+        total['wall'] += phase['wall']
+        total['cpu'] += phase['cpu']
+
+
+def annotationProfile(profile, annotation_fn):
+    return profile['annotations'].setdefault(annotation_fn, {'phases': {}, 'latencies': [], 'task_wall': 0.0,
+                                                            'tmp_bytes': 0, 'errors': []})
+
+
+def addTask(profile, annotation_fn, num_iters, task_stats):
+    # num_iters iterations ran in this task; each is charged an equal share of its wall time
+    annotation = annotationProfile(profile, annotation_fn)
+    annotation['latencies'].extend([task_stats['wall'] / max(num_iters, 1)] * num_iters)
+    annotation['task_wall'] += task_stats['wall']
+    annotation['tmp_bytes'] += task_stats['tmp_bytes']
+    annotation['errors'].extend(task_stats['errors'][:MAX_ERRORS - len(annotation['errors'])])
+    mergePhases(annotation['phases'], task_stats['phases'])
+
+    worker = profile['workers'].setdefault(str(task_stats['pid']), {'tasks': 0, 'wall': 0.0, 'cpu': 0.0, 'tmp_bytes': 0,
+                                                                    'peak_rss_mb': 0.0, 'peak_child_rss_mb': 0.0})
+    worker['tasks'] += 1
+    worker['wall'] += task_stats['wall']
+    worker['cpu'] += task_stats['cpu']
+    worker['tmp_bytes'] += task_stats['tmp_bytes']
+    worker['peak_rss_mb'] = max(worker['peak_rss_mb'], task_stats['peak_rss_mb'])
+    worker['peak_child_rss_mb'] = max(worker['peak_child_rss_mb'], task_stats['peak_child_rss_mb'])
+
+
+def addAnnotationResult(profile, annotation_fn, simulation_wall, num_threads, exp_sum_list):
+    annotation = annotationProfile(profile, annotation_fn)
+    annotation['simulation_wall'] = simulation_wall
+    # time the pool spent on anything but running tasks: pickling, dispatch and idle workers
+    annotation['pool_overhead'] = max(0.0, simulation_wall - annotation['task_wall'] / max(num_threads, 1))
+    annotation['iterations'] = len(exp_sum_list)
+    annotation['failed_iterations'] = sum(1 for x in exp_sum_list if np.any(np.asarray(x) == -999))
+
+
+def latencySummary(latencies):
+    if not latencies:
+        return {}
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {'mean': float(np.mean(latencies)), 'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+            'max': float(np.max(latencies))}
+
+
+def writeProfile(filename, profile):
+    for annotation in profile['annotations'].values():
+        annotation['iteration_latency'] = latencySummary(annotation.pop('latencies'))
+
+    profile['phases'] = STATS['phases']
+    profile['tmp_bytes'] = STATS['tmp_bytes'] + sum(a['tmp_bytes'] for a in profile['annotations'].values())
+    profile['peak_rss_mb'] = peakRssMb()
+    profile['peak_worker_rss_mb'] = max([w['peak_rss_mb'] for w in profile['workers'].values()], default=0.0)
+    # largest child of the parent (a bedtools process or a reaped worker) or of any worker
+    profile['peak_child_rss_mb'] = max([w['peak_child_rss_mb'] for w in profile['workers'].values()] + [peakChildRssMb()])
+
+    with open(filename, 'w') as outfile:
+        json.dump(profile, outfile, indent=2)
+        outfile.write('\n')
@@ -0,0 +1,399 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   long-running server for numpy-engine enrichment and jaccard jobs, so that many
+#   small jobs stop paying for interpreter start-up, chrom sizes lookups, blacklist
+#   hashing and BED parsing every time; query it with enrichment_client.py
+#
+#   genomes, allowed-genome segments, test indexes, prepared annotations and merged
+#   jaccard inputs are kept in one LRU cache bounded by --cache_mb (array bytes);
+#   entries are keyed by path, size and mtime so an edited file is read again.
+#   test indexes and prepared annotations are also saved as .npy directories that
+#   the workers memory-map, so simulation tasks only pass their paths.
+#   requests are JSON lines over a unix socket: {"tool", "args", "cwd"} in,
+#   {"stdout", "stderr", "status"} out, the same text the scripts would print
+#
+#   depends on:
+#       numpy
+#       numpy_engine.py, bed_reader.py, gc_index.py, jaccard_engine.py,
+#       enrichment_counts.py (same directory)
+###
+
+import io
+import os
+import sys
+import json
+import shutil
+import signal
+import asyncio
+import argparse
+import datetime
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy_engine
+from bed_reader import column_values, read_bed
+from gc_index import load_gc_index, match_gc
+from jaccard_engine import intersection_bp, jaccard, load_merged
+from enrichment_counts import (DEFAULT_BLACKLISTS, addEnrichmentArguments, countFilename, groupFilename, readManifest,
+                               reportCounts, resultHeader)
+
+
+DEFAULT_SOCKET = os.getenv('ENRICHMENT_SERVER_SOCKET', os.path.join(os.path.expanduser('~'), '.cache', 'enrichment_server.sock'))
+
+# memory-mapped index directories a worker keeps open between tasks
+WORKER_MAPS = 8
+
+
+###
+#   arguments
+###
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serve enrichment and jaccard requests from a warm cache.")
+
+    arg_parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET,
+                            help='unix socket to listen on; default=$ENRICHMENT_SERVER_SOCKET or ~/.cache/enrichment_server.sock')
+    arg_parser.add_argument("--cache_mb", type=float, default=2048,
+                            help='memory budget of cached arrays in MB, least recently used evicted first; default=2048')
+    arg_parser.add_argument("--cache_dir", type=str, default=numpy_engine.DEFAULT_CACHE_DIR,
+                            help='directory of cached allowed-genome segments; default=$ALLOWED_GENOME_CACHE or ~/.cache/allowed_genome')
+    arg_parser.add_argument("-n", "--num_threads", type=int,
+                            help='number of worker processes; default=SLURM_CPUS_PER_TASK or 1')
+
+    args = arg_parser.parse_args()
+
+
+###
+#   request arguments (those of calculate_enrichment.py, from enrichment_counts.py, and calculate_jaccard.py)
+###
+class RequestError(Exception):
+    pass
+
+
+class RequestParser(argparse.ArgumentParser):
+    # report bad arguments to the client instead of exiting the server
+    def error(self, message):
+        raise RequestError('{}: error: {}'.format(self.prog, message))
+
+    def exit(self, status=0, message=None):
+        raise RequestError(message or '')
+
+
+def enrichmentParser():
+    parser = addEnrichmentArguments(RequestParser(prog='calculate_enrichment.py', add_help=False))
+    # the server only runs the numpy engine, on its own pool
+    parser.set_defaults(engine='numpy')
+    return parser
+
+
+def jaccardParser():
+    parser = RequestParser(prog='calculate_jaccard.py', add_help=False)
+    parser.add_argument("bed_files", nargs=2)
+    parser.add_argument('-d', '--decimal', type=int, default=3)
+    return parser
+
+
+def resolvePath(cwd, path):
+    # paths are relative to the client's working directory
+    if path is None or path == '-' or os.path.isabs(path):
+        return path
+    return os.path.join(cwd, path)
+
+
+###
+#   cache (server process)
+###
+CACHE = OrderedDict()
+CACHE_BYTES = 0
+CACHE_LIMIT = 0
+CACHE_LOCK = threading.Lock()
+
+# index directories of evicted entries, removed once no request is running
+RETIRED = []
+ACTIVE = 0
+
+# chromosome codes shared by every merged jaccard input
+JACCARD_CODES = {}
+
+
+def arrayBytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(arrayBytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(arrayBytes(v) for v in value)
+    return 0
+
+
+def fileKey(path):
+    # a file is reloaded when it changes on disk
+    if path is None or not os.path.isfile(path):
+        return path
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def retire(value):
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[1], str) and os.path.isdir(value[1]):
+        RETIRED.append(value[1])
+
+
+def cached(key, load):
+    # least-recently-used lookup; loads run outside the lock, so two requests may both
+    # load a new entry and the second result is kept
+    global CACHE_BYTES
+    with CACHE_LOCK:
+        if key in CACHE:
+            CACHE.move_to_end(key)
+            return CACHE[key][0]
+
+    value = load()
+    size = arrayBytes(value)
+    with CACHE_LOCK:
+        if key in CACHE:
+            old, old_size = CACHE.pop(key)
+            CACHE_BYTES -= old_size
+            retire(old)
+        CACHE[key] = (value, size)
+        CACHE_BYTES += size
+        while CACHE_BYTES > CACHE_LIMIT and len(CACHE) > 1:
+            _, (old, old_size) = CACHE.popitem(last=False)
+            CACHE_BYTES -= old_size
+            retire(old)
+    return value
+
+
+def cacheStatus():
+    with CACHE_LOCK:
+        return 'entries\t{}\ncache_mb\t{:.1f}\nlimit_mb\t{:.1f}\n'.format(len(CACHE), CACHE_BYTES / 2**20, CACHE_LIMIT / 2**20) + \
+               ''.join('{}\t{:.1f}\n'.format(key[0], size / 2**20) for key, (_, size) in CACHE.items())
+
+
+def genomeKey(species, sizes_fn):
+    # a sizes file (by path, size and mtime) or an assembly name, never one taken for the other
+    return ('sizes', fileKey(sizes_fn)) if sizes_fn is not None else ('assembly', species)
+
+
+def genomeFor(species, sizes_fn):
+    return cached(('genome', genomeKey(species, sizes_fn)), lambda: numpy_engine.load_genome(species, sizes_fn))
+
+
+def allowedFor(genome, genome_key, blacklist):
+    # the on-disk cache is keyed by a hash of the blacklist contents; remembering the directory
+    # per (path, size, mtime) skips reading the blacklist again
+    key = ('allowed', genome_key, fileKey(blacklist))
+    return cached(key, lambda: numpy_engine.allowed_segments_cache(genome, blacklist, args.cache_dir))
+
+
+def testIndexFor(genome, genome_key, test_fn, strand, group_by):
+    def load():
+        test = read_bed(test_fn, keep_fields=group_by is not None)
+        groups = column_values(test, group_by) if group_by is not None else None
+        index = numpy_engine.build_index(test, genome, strand, groups)
+        return index, numpy_engine.save_arrays(index, tempfile.mkdtemp(prefix='test_index.'))
+
+    return cached(('index', genome_key, fileKey(test_fn), strand, group_by), load)
+
+
+def annotationFor(genome, genome_key, annotation_fn, gc_dir, gc_bins):
+    def load():
+        annotation = numpy_engine.prepare_annotation(read_bed(annotation_fn), genome)
+        if gc_dir is not None:
+            annotation = match_gc(annotation, load_gc_index(gc_dir), genome, gc_bins)
+        return annotation, numpy_engine.save_arrays(annotation, tempfile.mkdtemp(prefix='annotation.'))
+
+    return cached(('annotation', genome_key, fileKey(annotation_fn), gc_dir, gc_bins), load)
+
+
+def mergedFor(filename):
+    return cached(('merged', fileKey(filename)), lambda: load_merged(filename, JACCARD_CODES))
+
+
+###
+#   simulations (worker processes)
+###
+MAPS = OrderedDict()
+
+
+def mapped(directory):
+    if directory not in MAPS:
+        MAPS[directory] = numpy_engine.load_arrays(directory)
+        if len(MAPS) > WORKER_MAPS:
+            MAPS.popitem(last=False)
+    MAPS.move_to_end(directory)
+    return MAPS[directory]
+
+
+def simulateBlock(index_dir, allowed_dir, gc_dir, annotation_dir, genome, elementwise, hapblock, strand, seed, block):
+    # numpy_engine.simulate_block, as calculateExpectedNumpy in calculate_enrichment.py, on mapped arrays
+    return numpy_engine.simulate_block(mapped(index_dir), mapped(allowed_dir), mapped(annotation_dir), genome, elementwise,
+                                       hapblock, strand, seed, block, gc=mapped(gc_dir) if gc_dir is not None else None)
+
+
+###
+#   requests
+###
+def prepareEnrichment(opts, cwd):
+    # annotations keep the names given, for the output rows, and are read relative to cwd
+    annotation_fns = ([opts.region_file_1] if opts.region_file_1 else []) + opts.annotation
+    if opts.manifest:
+        annotation_fns += readManifest(resolvePath(cwd, opts.manifest))
+    if not annotation_fns:
+        raise RequestError('calculate_enrichment.py: error: no bed file 1 given; pass region_file_1, --annotation or --manifest')
+
+    # a chromosome sizes file has no default blacklist
+    sizes_fn = resolvePath(cwd, opts.chrom_sizes)
+    genome_key = genomeKey(opts.species, sizes_fn)
+    if opts.blacklist is not None:
+        blacklist = resolvePath(cwd, opts.blacklist)
+    else:
+        blacklist = DEFAULT_BLACKLISTS.get(opts.species) if sizes_fn is None else None
+    gc_dir = resolvePath(cwd, opts.gc_index)
+
+    genome = genomeFor(opts.species, sizes_fn)
+    allowed_dir = allowedFor(genome, genome_key, blacklist)
+    index, index_dir = testIndexFor(genome, genome_key, resolvePath(cwd, opts.region_file_2), opts.stranded, opts.group_by)
+
+    return annotation_fns, genome_key, genome, allowed_dir, index, index_dir, gc_dir
+
+
+async def runEnrichment(loop, pool, argv, cwd):
+    opts = enrichmentParser().parse_intermixed_args(argv)
+    if opts.engine != 'numpy':
+        raise RequestError('calculate_enrichment.py: error: enrichment_server.py only runs --engine numpy')
+    annotation_fns, genome_key, genome, allowed_dir, index, index_dir, gc_dir = \
+        await loop.run_in_executor(None, prepareEnrichment, opts, cwd)
+
+    seed = opts.seed if opts.seed is not None else np.random.SeedSequence().entropy
+    batch_size = max(1, opts.batch_size)
+    multiple = len(annotation_fns) > 1
+    count_fn = resolvePath(cwd, opts.print_counts_to)
+
+    out, err = io.StringIO(), io.StringIO()
+    print('python calculate_enrichment.py {:s} {:s}'.format(' '.join(argv), str(datetime.datetime.now())[:20]), file=out)
+    print(resultHeader(multiple, opts.group_by is not None), file=out)
+    failed = 0
+    for annotation_fn in annotation_fns:
+        prefix = annotation_fn + '\t' if multiple else ''
+        try:
+            annotation, annotation_dir = await loop.run_in_executor(None, annotationFor, genome, genome_key,
+                                                                    resolvePath(cwd, annotation_fn), gc_dir, opts.gc_bins)
+        except numpy_engine.ShuffleError as e:
+            print(f'{prefix}ERROR: {e}', file=err)
+            failed += 1
+            continue
+
+        # off the event loop, so other clients are served while a large annotation is counted
+        obs_sum = await loop.run_in_executor(None, numpy_engine.count_placed, index, annotation, genome, annotation['start'],
+                                             opts.elem_wise, opts.by_hap_block, opts.stranded)
+        block_size = numpy_engine.block_rows(len(annotation['chrom']), batch_size)
+        blocks = [(i, min(i + block_size, opts.iters)) for i in range(0, opts.iters, block_size)]
+        results = await asyncio.gather(*(loop.run_in_executor(pool, simulateBlock, index_dir, allowed_dir, gc_dir, annotation_dir,
+                                                              genome, opts.elem_wise, opts.by_hap_block, opts.stranded,
+                                                              seed, block) for block in blocks))
+        exp_sum_list = [row for counts in results for row in np.asarray(counts).astype(int).tolist()]
+
+        annotation_count_fn = countFilename(count_fn, annotation_fn, multiple) if count_fn else None
+        if opts.group_by is None:
+            failed += not reportCounts(prefix, obs_sum, exp_sum_list, annotation_count_fn, out, err)
+            continue
+        for j, group in enumerate(index['group_names']):
+            group_fn = groupFilename(annotation_count_fn, group) if annotation_count_fn else None
+            failed += not reportCounts(prefix + group + '\t', int(obs_sum[j]), [row[j] for row in exp_sum_list],
+                                       group_fn, out, err)
+
+    return out.getvalue(), err.getvalue(), 1 if failed else 0
+
+
+def runJaccard(argv, cwd):
+    opts = jaccardParser().parse_args(argv)
+    a, b = (mergedFor(resolvePath(cwd, f)) for f in opts.bed_files)
+    result, relative = jaccard(intersection_bp(a, b), a['length'], b['length'])
+
+    return 'Jaccard: {}\nRelative Jaccard: {}\n'.format(round(result, opts.decimal), round(relative, opts.decimal)), '', 0
+
+
+async def handleRequest(loop, pool, request):
+    global ACTIVE
+    tool, argv, cwd = request.get('tool'), request.get('args', []), request.get('cwd', os.getcwd())
+
+    ACTIVE += 1
+    try:
+        if tool == 'enrichment':
+            return await runEnrichment(loop, pool, argv, cwd)
+        if tool == 'jaccard':
+            return await loop.run_in_executor(None, runJaccard, argv, cwd)
+        if tool == 'status':
+            return cacheStatus(), '', 0
+        raise RequestError('unknown tool: {}'.format(tool))
+    except RequestError as e:
+        return '', str(e).rstrip('\n') + '\n', 2
+    except (OSError, ValueError, numpy_engine.ShuffleError) as e:
+        return '', 'ERROR: {}\n'.format(e), 1
+    finally:
+        ACTIVE -= 1
+        if ACTIVE == 0:
+            while RETIRED:
+                shutil.rmtree(RETIRED.pop(), ignore_errors=True)
+
+
+async def serveClient(pool, reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                out, err, status = await handleRequest(loop, pool, json.loads(line))
+            except json.JSONDecodeError as e:
+                out, err, status = '', 'bad request: {}\n'.format(e), 2
+            response = {'stdout': out, 'stderr': err, 'status': status}
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+###
+#   main
+###
+async def serve(socket_fn, num_threads):
+    with ProcessPoolExecutor(num_threads) as pool:
+        server = await asyncio.start_unix_server(lambda r, w: serveClient(pool, r, w), path=socket_fn, limit=1 << 24)
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        print('listening on {} with {} workers'.format(socket_fn, num_threads), file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv):
+    global CACHE_LIMIT
+    CACHE_LIMIT = int(args.cache_mb * 2**20)
+    num_threads = args.num_threads if args.num_threads else int(os.getenv('SLURM_CPUS_PER_TASK', 1))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+
+    try:
+        asyncio.run(serve(args.socket, num_threads))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        for value, _ in CACHE.values():
+            retire(value)
+        for directory in RETIRED:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,188 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   per-species GC bin index for GC-matched null backgrounds: the GC percent of
+#   every fixed-size window of the genome, plus the windows sorted by GC so that
+#   any GC stratum is one contiguous slice; built once from a local FASTA (or 2bit,
+#   with py2bit installed) by build_gc_index.py and memory-mapped afterwards. the
+#   index records the chromosome names and sizes it was built for and is refused
+#   for any other genome
+#
+#   depends on:
+#       numpy
+#       numpy_engine.py (same directory)
+#       py2bit (only to read .2bit files)
+###
+
+import os
+import gzip
+import shutil
+import tempfile
+import numpy as np
+
+from numpy_engine import ShuffleError, load_arrays, save_arrays
+
+
+# windows with fewer than half their bases called (A/C/G/T) get no GC value
+GC_MASKED = 255
+
+DEFAULT_WINDOW = 1000
+
+
+###
+#   building
+###
+def gc_index_path(genome, window, cache_dir):
+    return os.path.join(cache_dir, '{}.gc{}'.format(genome['name'], window))
+
+
+def sequence_chunks(filename, chunk_size=1 << 22):
+    # yields (chrom, bytes) pieces of each sequence in file order
+    if filename.endswith('.2bit'):
+        import py2bit
+
+        tb = py2bit.open(filename)
+        for chrom, size in tb.chroms().items():
+            for start in range(0, size, chunk_size):
+                yield chrom, tb.sequence(chrom, start, min(start + chunk_size, size)).encode()
+        tb.close()
+        return
+
+    with (gzip.open(filename, 'rb') if filename.endswith('.gz') else open(filename, 'rb')) as infile:
+        chrom, buf, size = None, [], 0
+        for line in infile:
+            if line.startswith(b'>'):
+                if buf:
+                    yield chrom, b''.join(buf)
+                chrom, buf, size = line[1:].split()[0].decode(), [], 0
+                continue
+            buf.append(line.rstrip())
+            size += len(buf[-1])
+            if size >= chunk_size:
+                yield chrom, b''.join(buf)
+                buf, size = [], 0
+        if buf:
+            yield chrom, b''.join(buf)
+
+
+def window_counts(genome, sequence_fn, window):
+    # G/C and called-base counts per window, windows numbered across the genome in chromosome order
+    num_windows = -(-genome['sizes'] // window)
+    window_offsets = np.concatenate(([0], np.cumsum(num_windows)))
+    gc_count = np.zeros(window_offsets[-1], dtype=np.int64)
+    called = np.zeros(window_offsets[-1], dtype=np.int64)
+
+    chrom, pos, matched = None, 0, False
+    for name, chunk in sequence_chunks(sequence_fn):
+        if name != chrom:
+            chrom, pos = name, 0
+        code = genome['codes'].get(name)
+        if code is None:
+            continue
+        matched = True
+
+        bases = np.frombuffer(chunk, dtype=np.uint8)[:max(0, genome['sizes'][code] - pos)] & 0xDF # upper case
+        if len(bases) == 0:
+            continue
+        is_gc = (bases == ord('G')) | (bases == ord('C'))
+        is_called = is_gc | (bases == ord('A')) | (bases == ord('T'))
+
+        # windows of this chunk, relative to the window holding its first base
+        windows = (pos % window + np.arange(len(bases))) // window
+        at = window_offsets[code] + pos // window
+        gc_count[at:at + windows[-1] + 1] += np.bincount(windows, weights=is_gc).astype(np.int64)
+        called[at:at + windows[-1] + 1] += np.bincount(windows, weights=is_called).astype(np.int64)
+        pos += len(bases)
+
+    if not matched:
+        raise ValueError('no sequence in {} is named like a chromosome of {}'.format(sequence_fn, genome['name']))
+
+    return window_offsets, gc_count, called
+
+
+def gc_windows(genome, sequence_fn, window=DEFAULT_WINDOW):
+    window_offsets, gc_count, called = window_counts(genome, sequence_fn, window)
+
+    # genome-coordinate extent of every window; the last window of a chromosome is cut short
+    chrom = np.repeat(np.arange(len(genome['sizes'])), np.diff(window_offsets))
+    local = (np.arange(window_offsets[-1]) - window_offsets[chrom]) * window
+    starts = genome['offsets'][chrom] + local
+    ends = genome['offsets'][chrom] + np.minimum(local + window, genome['sizes'][chrom])
+
+    gc = np.full(len(starts), GC_MASKED, dtype=np.uint8)
+    ok = 2 * called >= ends - starts
+    gc[ok] = np.rint(100 * gc_count[ok] / np.maximum(called[ok], 1)).astype(np.uint8)
+
+    # windows sorted by GC percent; pct_bounds[p] is where percent p starts in order
+    order = np.flatnonzero(ok)[np.argsort(gc[ok], kind='stable')]
+    pct_bounds = np.searchsorted(gc[order], np.arange(102), side='left')
+
+    return {'window': np.array(window), 'window_offsets': window_offsets, 'window_starts': starts,
+            'window_ends': ends, 'gc': gc, 'order': order, 'pct_bounds': pct_bounds,
+            'chrom_names': np.array(genome['names'], dtype=str), 'chrom_sizes': genome['sizes']}
+
+
+def build_gc_index(genome, sequence_fn, window=DEFAULT_WINDOW, path=None, cache_dir=None):
+    # written to a temporary directory and renamed into place, as the allowed-segment cache
+    path = path if path is not None else gc_index_path(genome, window, cache_dir)
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+
+    tmp = save_arrays(gc_windows(genome, sequence_fn, window), tempfile.mkdtemp(dir=parent))
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+
+    return path
+
+
+###
+#   matching
+###
+def check_genome(index, genome):
+    # window numbers only mean something for the chromosomes the index was built from
+    if 'chrom_names' not in index:
+        raise ShuffleError('GC index has no genome record; rebuild it with build_gc_index.py')
+    if index['chrom_names'].tolist() != list(genome['names']) or not np.array_equal(index['chrom_sizes'], genome['sizes']):
+        raise ShuffleError('GC index was built for other chromosomes than {}; rebuild it for this genome'.format(genome['name']))
+
+
+def load_gc_index(path, genome=None):
+    index = load_arrays(path)
+    if genome is not None:
+        check_genome(index, genome)
+    return index
+
+
+def interval_gc(index, genome, starts, ends):
+    # mean GC percent of the called windows that each genome-coordinate interval touches
+    window = int(index['window'])
+    chrom = np.searchsorted(genome['offsets'], starts, side='right') - 1
+    first = index['window_offsets'][chrom] + (starts - genome['offsets'][chrom]) // window
+    last = index['window_offsets'][chrom] + (np.maximum(ends - 1, starts) - genome['offsets'][chrom]) // window
+
+    ok = index['gc'] != GC_MASKED
+    gc_sums = np.concatenate(([0], np.cumsum(np.where(ok, index['gc'], 0))))
+    called = np.concatenate(([0], np.cumsum(ok)))
+    num = called[last + 1] - called[first]
+    if (num == 0).any():
+        raise ShuffleError('{} intervals lie entirely in windows without GC values'.format(int((num == 0).sum())))
+
+    return np.rint((gc_sums[last + 1] - gc_sums[first]) / num).astype(np.int64)
+
+
+def match_gc(annotation, index, genome, bins=20):
+    # each interval may be placed in any window from its GC stratum, one of bins equal-width
+    # bins over 0-100%; gc_lo/gc_hi are the stratum's slice of index['order']
+    check_genome(index, genome)
+    pct_bin = np.arange(101) * bins // 101
+    strata = pct_bin[interval_gc(index, genome, annotation['start'], annotation['start'] + annotation['length'])]
+    lo = index['pct_bounds'][np.searchsorted(pct_bin, strata, side='left')]
+    hi = index['pct_bounds'][np.searchsorted(pct_bin, strata, side='right')]
+
+    if (hi == lo).any():
+        raise ShuffleError('no windows in the GC stratum of {} intervals'.format(int((hi == lo).sum())))
+
+    return dict(annotation, gc_lo=lo, gc_hi=hi)
@@ -3,18 +3,28 @@
 #   name    | mary lauren benton
 #   created | 2017
 #   updated | 2021
+#           | 2026.10.18
 #
 #   depends on:
 #       BEDtools v2.23.0-20 via pybedtools
+#       numpy_engine.py and bed_reader.py (same directory) for --engine numpy
+#       gc_index.py (same directory) for --gc_index
 ###
 
 import os
 import sys, traceback
+import gzip
 import argparse
 import numpy as np
+from functools import partial
+from multiprocessing import Pool
 from pybedtools import BedTool
 from pybedtools.helpers import BEDToolsError, cleanup, get_tempdir, set_tempdir
 
+import numpy_engine
+from bed_reader import read_bed
+from gc_index import load_gc_index, match_gc
+
 
 ###
 #   arguments
@@ -33,37 +43,169 @@ arg_parser.add_argument("-b", "--blacklist", type=str, default=None,
 arg_parser.add_argument("-o", "--outfile", type=str, default='random.bed',
                         help="name of randomized bed file; default=random.bed")
 
+arg_parser.add_argument("--engine", type=str, default='bedtools', choices=['bedtools', 'numpy'],
+                        help='shuffle with bedtools or in memory with numpy; default=bedtools')
+
+arg_parser.add_argument("--cache_dir", type=str, default=numpy_engine.DEFAULT_CACHE_DIR,
+                        help='directory of cached allowed-genome segments (numpy engine only); default=$ALLOWED_GENOME_CACHE or ~/.cache/allowed_genome')
+
+arg_parser.add_argument("-c", "--count", type=int, default=1,
+                        help='number of shuffles; with more than one, shuffle i is written to outfile with .i before the extension; default=1')
+
+arg_parser.add_argument("--single_file", action='store_true', default=False,
+                        help='write every shuffle to outfile (gzipped if it ends in .gz) with the shuffle number as a last column; default=False')
+
+arg_parser.add_argument("--seed", type=int, default=None,
+                        help='seed for reproducible shuffles; shuffle i gets the same stream for any thread count or batch size; default=None')
+
+arg_parser.add_argument("--batch_size", type=int, default=100,
+                        help='shuffles generated together in one vectorized block, fewer for large annotations (numpy engine only); default=100')
+
+arg_parser.add_argument("-n", "--num_threads", type=int,
+                        help='number of threads; default=SLURM_CPUS_PER_TASK or 1')
+
+arg_parser.add_argument("--gc_index", type=str, default=None,
+                        help='GC window index from build_gc_index.py; intervals are placed in windows of matching GC '
+                             '(anywhere in the genome) instead of on their own chromosome (numpy engine only); default=None')
+
+arg_parser.add_argument("--gc_bins", type=int, default=20,
+                        help='number of equal-width GC strata used with --gc_index; default=20')
+
 
 args = arg_parser.parse_args()
 
+if args.gc_index is not None and args.engine != 'numpy':
+    arg_parser.error('--gc_index requires --engine numpy')
+
+if args.count < 1 or args.batch_size < 1:
+    arg_parser.error('--count and --batch_size must be at least 1')
+
 # save parameters
 INPUT_FILENAME = args.input_bed
 SPECIES = args.species
 BLACKLIST = args.blacklist
-OUTPUT_FILENAME = args.output
+OUTPUT_FILENAME = args.outfile
+ENGINE = args.engine
+CACHE_DIR = args.cache_dir
+COUNT = args.count
+SINGLE_FILE = args.single_file
+BATCH_SIZE = args.batch_size
+GC_INDEX_DIR = args.gc_index
+GC_BINS = args.gc_bins
+NUM_THREADS = args.num_threads if args.num_threads else int(os.getenv('SLURM_CPUS_PER_TASK', 1))
+
+# without --seed every run still needs one root seed so the shuffles are independent
+SEED = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+
+# input, genome, allowed segments and GC index shared with the worker processes by initWorker
+BED, GENOME, ANNOTATION, ALLOWED, GC_INDEX = None, None, None, None, None
 
 
 # if running on slurm, set tmp to runtime dir
 set_tempdir(os.getenv('ACCRE_RUNTIME_DIR', get_tempdir()))
 
 
+###
+#   functions
+###
+def sampleFilename(output_fn, sample, count):
+    if count == 1:
+        return output_fn
+
+    gz = '.gz' if output_fn.endswith('.gz') else ''
+    root, ext = os.path.splitext(output_fn[:len(output_fn) - len(gz)])
+    return '{}.{:0{}d}{}{}'.format(root, sample, len(str(count - 1)), ext, gz)
+
+
+def openOutput(output_fn):
+    return gzip.open(output_fn, 'wt') if output_fn.endswith('.gz') else open(output_fn, 'w')
+
+
+def initWorker(bed, genome, annotation, allowed_dir, gc_dir):
+    global BED, GENOME, ANNOTATION, ALLOWED, GC_INDEX
+    BED, GENOME, ANNOTATION = bed, genome, annotation
+    ALLOWED = numpy_engine.load_arrays(allowed_dir)
+    GC_INDEX = load_gc_index(gc_dir) if gc_dir is not None else None
+
+
+def shuffleBlock(seed, count, output_fn, single_file, block):
+    # shuffles first..last-1 in one vectorized call; single-file blocks are returned as
+    # text so the parent writes them in order, numbered files are written here
+    first, last = block
+    rand_starts = numpy_engine.shuffle_block(ANNOTATION, ALLOWED, seed, block, gc=GC_INDEX)
+
+    if single_file:
+        return ''.join(numpy_engine.format_bed(BED, GENOME, starts, sample=i) for i, starts in zip(range(first, last), rand_starts))
+
+    for i, starts in zip(range(first, last), rand_starts):
+        numpy_engine.write_bed(sampleFilename(output_fn, i, count), BED, GENOME, starts)
+    return ''
+
+
+def shuffleNumpy(input_fn, species, blacklist, cache_dir, output_fn, count, single_file, seed, batch_size, num_threads,
+                 gc_dir=None, gc_bins=20):
+    genome = numpy_engine.load_genome(species)
+    allowed_dir = numpy_engine.allowed_segments_cache(genome, blacklist, cache_dir)
+    bed = read_bed(input_fn, keep_fields=True)
+    annotation = numpy_engine.prepare_annotation(bed, genome)
+    if gc_dir is not None:
+        annotation = match_gc(annotation, load_gc_index(gc_dir), genome, gc_bins)
+
+    block_size = numpy_engine.block_rows(len(annotation['chrom']), batch_size)
+    blocks = [(first, min(first + block_size, count)) for first in range(0, count, block_size)]
+    run = partial(shuffleBlock, seed, count, output_fn, single_file)
+
+    with Pool(min(num_threads, len(blocks)), initializer=initWorker, initargs=(bed, genome, annotation, allowed_dir, gc_dir)) as pool:
+        if not single_file:
+            for _ in pool.imap_unordered(run, blocks):
+                pass
+            return
+
+        with openOutput(output_fn) as outfile:
+            for text in pool.imap(run, blocks):
+                outfile.write(text)
+
+
+def shuffleBedtools(input_fn, species, blacklist, output_fn, count, single_file, seed):
+    # one bedtools shuffle per sample; pybedtools would pass excl=None on as '-excl None'
+    outfile = openOutput(output_fn) if single_file else None
+    excl_args = {'excl': blacklist} if blacklist is not None else {}
+
+    for i in range(count):
+        rand_file = BedTool(input_fn).shuffle(genome=species, chrom=True, noOverlapping=True,
+                                              seed=int(numpy_engine.iteration_seed(seed, i).generate_state(1)[0]), **excl_args)
+        if single_file:
+            for line in open(rand_file.fn):
+                outfile.write('{}\t{}\n'.format(line.rstrip('\n'), i))
+        else:
+            rand_file.moveto(sampleFilename(output_fn, i, count))
+
+    if outfile is not None:
+        outfile.close()
+
+
 ###
 #   main
 ###
 def main(argv):
 
-    # generate random bed file based on input bed file
+    if ENGINE == 'numpy':
+        try:
+            shuffleNumpy(INPUT_FILENAME, SPECIES, BLACKLIST, CACHE_DIR, OUTPUT_FILENAME,
+                         COUNT, SINGLE_FILE, SEED, BATCH_SIZE, NUM_THREADS, GC_INDEX_DIR, GC_BINS)
+        except numpy_engine.ShuffleError as e:
+            print(f'ERROR: Shuffling failed: {e}')
+            exit(1)
+        return
+
+    # generate random bed files based on input bed file
     try:
-        rand_file = INPUT_FILENAME.shuffle(genome=SPECIES, excl=BLACKLIST, 
-                                           chrom=True, noOverlapping=True)
+        shuffleBedtools(INPUT_FILENAME, SPECIES, BLACKLIST, OUTPUT_FILENAME, COUNT, SINGLE_FILE, SEED)
     except BEDToolsError:
         print('ERROR: Shuffling produced BEDToolsError.')
         cleanup()
         exit(1)
 
-    # write ouput file
-    rand_file.moveto(OUTPUT_FILENAME)
-
 
     # clean up any pybedtools tmp files
     cleanup()
@@ -71,4 +213,3 @@ def main(argv):
 
 if __name__ == "__main__":
     main(sys.argv[1:])
-
@@ -0,0 +1,62 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   jaccard and relative jaccard from merged interval sets, shared by
+#   calculate_jaccard.py and enrichment_server.py
+#
+#   depends on:
+#       numpy
+#       bed_reader.py, numpy_engine.py (same directory)
+###
+
+import numpy as np
+
+from bed_reader import read_bed
+from numpy_engine import merge_intervals, overlap_bp
+
+
+# chromosomes are laid end to end this far apart, well beyond any chromosome length
+CHROM_SPAN = 1 << 40
+
+
+def load_merged(filename, codes):
+    # merged intervals plus the cached merged length and chromosome set of one file;
+    # read_bed numbers chromosomes in order of first appearance (shared across files through
+    # codes), so a file sorted by chromosome block and then start is already sorted once the
+    # chromosomes are laid end to end, and merge_intervals skips the sort
+    bed = read_bed(filename, codes=codes)
+    keys = bed['chrom_code'].astype(np.int64) * CHROM_SPAN
+    starts, ends = merge_intervals(keys + bed['start'], keys + bed['end'])
+
+    return {'starts': starts, 'ends': ends, 'length': int((ends - starts).sum()),
+            'chroms': np.unique(starts // CHROM_SPAN)}
+
+
+def intersection_bp(a, b):
+    # files without a chromosome in common cannot overlap
+    if len(np.intersect1d(a['chroms'], b['chroms'], assume_unique=True)) == 0:
+        return 0
+
+    # merged intervals have sorted starts and sorted ends, which is all overlap_bp needs
+    index = {'starts': b['starts'], 'start_sums': np.concatenate(([0], np.cumsum(b['starts']))),
+             'ends': b['ends'], 'end_sums': np.concatenate(([0], np.cumsum(b['ends'])))}
+    return int(overlap_bp(index, a['starts'], a['ends']).sum())
+
+
+def jaccard(intersection, a_len, b_len):
+    union = a_len + b_len - intersection
+    result = intersection / union if union else 0.0
+    max_jaccard = min(a_len, b_len) / max(a_len, b_len) if max(a_len, b_len) else 0.0
+    relative = result / max_jaccard if max_jaccard else 0.0
+
+    return result, relative
+
+
+def partition_lengths(partition):
+    # (intersection, |a|, |b|) of one partition of two files from bed_partition.partition_beds;
+    # partitions never share an interval, so the three sums over partitions are exact
+    codes = {}
+    a, b = (load_merged(filename, codes) for filename in partition)
+    return intersection_bp(a, b), a['length'], b['length']
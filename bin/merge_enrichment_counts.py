@@ -0,0 +1,114 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   combine the count files written by calculate_enrichment.py --shard i/N
+#   and print the same result line as an unsharded run; refuses a set of files
+#   with a missing, duplicated or mismatched shard
+#
+#   depends on:
+#       enrichment_counts.py (same directory)
+###
+
+import sys
+import argparse
+import datetime
+
+from enrichment_counts import calculateEmpiricalP, readCounts, readShard, writeCounts
+
+
+###
+#   arguments
+###
+arg_parser = argparse.ArgumentParser(description="Merge sharded calculate_enrichment.py count files.")
+
+arg_parser.add_argument("count_files", nargs='+', help='count files from calculate_enrichment.py --shard')
+
+arg_parser.add_argument("--print_counts_to", type=str, default=None,
+                        help="print merged expected counts to file")
+
+args = arg_parser.parse_args()
+
+# save parameters
+COUNT_FILENAMES = args.count_files
+MERGED_FILENAME = args.print_counts_to
+
+
+###
+#   functions
+###
+def checkShards(filenames):
+    # every shard 1..N exactly once, their iteration ranges tiling 0..total; returns an error or None
+    shards = {}
+    for filename in filenames:
+        shard = readShard(filename)
+        if shard is None:
+            return '{} has no shard record; was it written by calculate_enrichment.py --shard?'.format(filename)
+        if shard[0] in shards:
+            return 'shard {}/{} given twice: {} and {}'.format(shard[0], shard[1], shards[shard[0]][0], filename)
+        shards[shard[0]] = (filename,) + shard
+
+    num_shards = {s[2] for s in shards.values()}
+    if len(num_shards) != 1:
+        return 'count files come from runs split into different numbers of shards: {}'.format(sorted(num_shards))
+    num_shards = num_shards.pop()
+
+    missing = sorted(set(range(1, num_shards + 1)) - set(shards))
+    if missing:
+        return 'missing shard(s) {} of {}'.format(', '.join(map(str, missing)), num_shards)
+
+    expected_first = 0
+    for i in range(1, num_shards + 1):
+        filename, _, _, first, last = shards[i]
+        if first != expected_first:
+            return 'shard {}/{} ({}) covers iterations {}:{}, expected to start at {}'.format(i, num_shards, filename, first, last, expected_first)
+        expected_first = last
+    return None
+
+
+###
+#   main
+###
+def main(argv):
+    error = checkShards(COUNT_FILENAMES)
+    if error is not None:
+        print(f'ERROR: {error}', file=sys.stderr)
+        sys.exit(1)
+
+    # print header
+    print('python {:s} {:s}'.format(' '.join(sys.argv), str(datetime.datetime.now())[:20]))
+    print('Observed\tExpected\tStdDev\tFoldChange\tp-value')
+
+    observed = set()
+    exp_sum_list = []
+    # counts are concatenated in iteration order, whatever order the files were given in
+    for filename in sorted(COUNT_FILENAMES, key=lambda f: readShard(f)[0]):
+        obs, exp_list = readCounts(filename)
+        observed.add(obs)
+        exp_sum_list += exp_list.tolist()
+
+    # every shard computes the same observed count; a mismatch means the inputs differed
+    if len(observed) != 1:
+        print(f'ERROR: shards disagree on the observed count: {sorted(observed)}', file=sys.stderr)
+        sys.exit(1)
+    obs_sum = observed.pop()
+
+    # remove iterations that throw bedtools exceptions
+    final_exp_sum_list = [x for x in exp_sum_list if x >= 0]
+    exceptions = exp_sum_list.count(-999)
+
+    # calculate empirical p value
+    if exceptions / max(len(exp_sum_list), 1) <= .1:
+        print(calculateEmpiricalP(obs_sum, final_exp_sum_list))
+        print(f'iterations not completed: {exceptions}', file=sys.stderr)
+    else:
+        print(f'iterations not completed: {exceptions}\nresulted in nonzero exit status', file=sys.stderr)
+        sys.exit(1)
+
+    if MERGED_FILENAME is not None:
+        writeCounts(MERGED_FILENAME, obs_sum, exp_sum_list)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
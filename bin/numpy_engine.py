@@ -0,0 +1,452 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   in-memory replacement for the bedtools shuffle + intersect loop used by
+#   calculate_enrichment.py; every interval is stored in a single 'genome'
+#   coordinate (chromosome offset + position) so that all chromosomes can be
+#   shuffled and intersected with one set of numpy calls
+#
+#   depends on:
+#       numpy
+#       pybedtools (only to look up chromosome sizes of named assemblies)
+#       bed_reader.py (same directory)
+###
+
+import os
+import gzip
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+from bed_reader import read_bed
+
+
+# bedtools shuffle gives up after this many attempts to place an interval
+MAX_TRIES = 1000
+
+# intervals shuffled together in one block (rows x annotation size), which bounds a block's memory
+ELEMENT_BUDGET = 1 << 21
+
+# allowed-genome segments are cached here, one directory per (species, blacklist) pair
+DEFAULT_CACHE_DIR = os.getenv('ALLOWED_GENOME_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'allowed_genome'))
+
+# strand codes used to keep stranded overlaps apart in genome coordinates
+STRAND_CODES = {'+': 1, '-': 2}
+
+
+class ShuffleError(Exception):
+    pass
+
+
+###
+#   loading
+###
+def chrom_sizes(species, sizes_fn=None):
+    # sizes_fn, when given, is a two-column file of chromosome names and lengths (custom or
+    # synthetic genomes) used instead of species, an assembly known to pybedtools
+    if sizes_fn is not None:
+        with open(sizes_fn, 'r') as infile:
+            fields = (line.split() for line in infile if line.strip() and not line.startswith('#'))
+            return {f[0]: int(f[1]) for f in fields}
+
+    from pybedtools.helpers import chromsizes
+    return {c: size[1] for c, size in chromsizes(species).items()}
+
+
+def load_genome(species, sizes_fn=None):
+    sizes = chrom_sizes(species, sizes_fn)
+    names = list(sizes.keys())
+    lengths = np.array([sizes[c] for c in names], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    return {'name': os.path.basename(sizes_fn) if sizes_fn is not None else species, 'names': names, 'codes': {c: i for i, c in enumerate(names)},
+            'sizes': lengths, 'offsets': offsets, 'length': int(offsets[-1])}
+
+
+def format_bed(bed, genome, starts, sample=None):
+    # intervals placed at genome-coordinate starts as BED lines, carrying over any extra
+    # columns; sample, when given, is appended as a last column. the chromosome is read back
+    # from the start, since GC-matched shuffles may move intervals between chromosomes
+    codes = np.searchsorted(genome['offsets'], starts, side='right') - 1
+    chroms = np.array(genome['names'], dtype=object)[codes]
+    local = starts - genome['offsets'][codes]
+    local_ends = local + (bed['end'] - bed['start'])
+    extra = bed.get('extra', [''] * len(local))
+    tail = '' if sample is None else '\t{}'.format(sample)
+
+    return ''.join('{}\t{}\t{}{}{}\n'.format(chrom, start, end, '\t' + rest if rest else '', tail)
+                   for chrom, start, end, rest in zip(chroms, local, local_ends, extra))
+
+
+def write_bed(filename, bed, genome, starts):
+    with (gzip.open(filename, 'wt') if filename.endswith('.gz') else open(filename, 'w')) as outfile:
+        outfile.write(format_bed(bed, genome, starts))
+
+
+def chrom_codes(chroms, genome):
+    # look up each distinct chromosome once; -1 marks chromosomes not in the genome
+    uniq, inverse = np.unique(chroms.astype(str), return_inverse=True)
+    uniq_codes = np.array([genome['codes'].get(c, -1) for c in uniq], dtype=np.int64)
+    return uniq_codes[inverse] if len(chroms) else np.zeros(0, dtype=np.int64)
+
+
+def strand_codes(strands):
+    return np.array([STRAND_CODES.get(s, 0) for s in strands], dtype=np.int64)
+
+
+def merge_intervals(starts, ends):
+    if len(starts) == 0:
+        return starts, ends
+
+    # sorting is skipped for input that is already in order
+    if np.any(starts[1:] < starts[:-1]):
+        order = np.argsort(starts, kind='stable')
+        starts, ends = starts[order], ends[order]
+    ends = np.maximum.accumulate(ends)
+
+    # a new merged interval begins wherever a start clears every previous end
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] > ends[:-1]
+    last = np.append(np.flatnonzero(new)[1:] - 1, len(starts) - 1)
+
+    return starts[new], ends[last]
+
+
+def save_arrays(arrays, directory):
+    # one .npy per array so that other processes can memory-map them instead of unpickling
+    os.makedirs(directory, exist_ok=True)
+    for key, values in arrays.items():
+        np.save(os.path.join(directory, key + '.npy'), np.asarray(values))
+    return directory
+
+
+def load_arrays(directory, mmap_mode='r'):
+    return {name[:-len('.npy')]: np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+            for name in os.listdir(directory) if name.endswith('.npy')}
+
+
+###
+#   setup
+###
+def prepare_annotation(bed, genome):
+    codes = chrom_codes(bed['chrom'], genome)
+    if (codes < 0).any():
+        missing = sorted(set(bed['chrom'][codes < 0]))
+        raise ShuffleError('chromosome not in genome: {}'.format(', '.join(missing)))
+
+    return {'chrom': codes,
+            'start': genome['offsets'][codes] + bed['start'],
+            'length': bed['end'] - bed['start'],
+            'strand': strand_codes(bed['strand'])}
+
+
+def allowed_segments(genome, blacklist=None):
+    # complement of the merged blacklist within each chromosome, in genome coordinates
+    if blacklist is None:
+        blacklist = {'chrom': np.zeros(0, dtype=object), 'start': np.zeros(0, dtype=np.int64),
+                     'end': np.zeros(0, dtype=np.int64)}
+
+    codes = chrom_codes(blacklist['chrom'], genome)
+    keep = codes >= 0
+    codes = codes[keep]
+    sizes = genome['sizes'][codes]
+    bl_starts = genome['offsets'][codes] + np.clip(blacklist['start'][keep], 0, sizes)
+    bl_ends = genome['offsets'][codes] + np.clip(blacklist['end'][keep], 0, sizes)
+    bl_starts, bl_ends = merge_intervals(bl_starts, bl_ends)
+
+    # chromosome boundaries are added as breakpoints so no segment spans two chromosomes
+    bounds = np.sort(np.concatenate((genome['offsets'], bl_starts, bl_ends)))
+    seg_starts, seg_ends = bounds[:-1], bounds[1:]
+
+    # keep the elementary pieces that are not covered by a blacklist interval
+    # (idx -1, no blacklist interval to the left, picks up the appended -1 and is never covered)
+    idx = np.searchsorted(bl_starts, seg_starts, side='right') - 1
+    covered = seg_ends <= np.append(bl_ends, -1)[idx]
+    keep = (seg_ends > seg_starts) & ~covered
+    seg_starts, seg_ends = seg_starts[keep], seg_ends[keep]
+
+    seg_chrom = np.searchsorted(genome['offsets'], seg_starts, side='right') - 1
+    cumlen = np.concatenate(([0], np.cumsum(seg_ends - seg_starts)))
+    chrom_first = np.searchsorted(seg_chrom, np.arange(len(genome['sizes']) + 1), side='left')
+
+    return {'starts': seg_starts, 'ends': seg_ends, 'cumlen': cumlen,
+            'chrom_offset': cumlen[chrom_first[:-1]],
+            'chrom_length': cumlen[chrom_first[1:]] - cumlen[chrom_first[:-1]]}
+
+
+def allowed_segments_cache(genome, blacklist_fn=None, cache_dir=DEFAULT_CACHE_DIR):
+    # the complement only depends on the chrom sizes and the blacklist contents, so it is
+    # computed by the first job to need it and memory-mapped by every later one
+    sha = hashlib.sha1('\t'.join(genome['names']).encode())
+    sha.update(genome['sizes'].tobytes())
+    if blacklist_fn is not None:
+        with open(blacklist_fn, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(1 << 20), b''):
+                sha.update(chunk)
+
+    path = os.path.join(cache_dir, '{}.{}'.format(genome.get('name', 'genome'), sha.hexdigest()[:16]))
+    if not os.path.isdir(path):
+        blacklist = read_bed(blacklist_fn) if blacklist_fn is not None else None
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = save_arrays(allowed_segments(genome, blacklist), tempfile.mkdtemp(dir=cache_dir))
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # another job finished writing the same segments first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    return path
+
+
+def build_index(bed, genome, stranded=False, groups=None):
+    # groups, one value per test interval, label-codes the index for count_overlaps_grouped
+    codes = chrom_codes(bed['chrom'], genome)
+    keep = codes >= 0
+    offsets = genome['offsets'][codes[keep]]
+    if stranded:
+        offsets = offsets + strand_codes(bed['strand'][keep]) * genome['length']
+
+    starts = offsets + bed['start'][keep]
+    ends = offsets + bed['end'][keep]
+    order = np.argsort(starts, kind='stable')
+    label_names, labels = np.unique(bed['label'][keep].astype(str), return_inverse=True)
+
+    index = {'starts': starts[order],
+             'start_sums': np.concatenate(([0], np.cumsum(starts[order]))),
+             'ends': np.sort(ends),
+             'end_sums': np.concatenate(([0], np.cumsum(np.sort(ends)))),
+             'max_ends': np.maximum.accumulate(ends[order]) if len(ends) else ends,
+             'start_order_ends': ends[order],
+             'labels': labels[order].astype(np.int64),
+             'label_names': label_names}
+    if groups is not None:
+        group_names, group_codes = np.unique(np.asarray(groups)[keep].astype(str), return_inverse=True)
+        index['groups'] = group_codes[order].astype(np.int64)
+        index['group_names'] = group_names
+
+    return index
+
+
+###
+#   shuffle
+###
+def uniform(rng, rows, k):
+    # a list of generators gives every row its own stream; rows must be sorted
+    if isinstance(rng, np.random.Generator):
+        return rng.random(len(rows))
+    counts = np.bincount(rows, minlength=k)
+    return np.concatenate([rng[r].random(count) for r, count in enumerate(counts)])
+
+
+def iteration_seed(seed, iteration):
+    # the same stream SeedSequence(seed).spawn() hands its child number `iteration`, so a
+    # given iteration is reproducible whatever the thread count, block size or shard
+    return np.random.SeedSequence(seed, spawn_key=(iteration,))
+
+
+def block_rows(n, batch_size):
+    # shuffles per block for an n-interval annotation: batch_size, or fewer when the block
+    # would hold more than ELEMENT_BUDGET intervals
+    return max(1, min(batch_size, ELEMENT_BUDGET // max(n, 1)))
+
+
+def draw_starts(annotation, allowed, rng, todo, n, k, lengths, starts, gc=None):
+    # one rejection-sampling round: new starts for the intervals in todo (positions in the
+    # K x n block), written to starts; returns which of them fit inside an allowed segment
+    c = annotation['chrom'][todo % n]
+    u = uniform(rng, todo // n, k)
+    if gc is None:
+        pos = allowed['chrom_offset'][c] + (u * allowed['chrom_length'][c]).astype(np.int64)
+        seg = np.searchsorted(allowed['cumlen'], pos, side='right') - 1
+        seg = np.minimum(seg, len(allowed['starts']) - 1)
+        starts[todo] = allowed['starts'][seg] + (pos - allowed['cumlen'][seg])
+
+        return (starts[todo] + lengths <= allowed['ends'][seg]) & (allowed['chrom_length'][c] > 0)
+
+    lo, hi = annotation['gc_lo'][todo % n], annotation['gc_hi'][todo % n]
+    w = gc['order'][lo + (u * (hi - lo)).astype(np.int64)]
+    u = uniform(rng, todo // n, k)
+    starts[todo] = gc['window_starts'][w] + (u * (gc['window_ends'][w] - gc['window_starts'][w])).astype(np.int64)
+
+    seg = np.maximum(np.searchsorted(allowed['starts'], starts[todo], side='right') - 1, 0)
+    return (starts[todo] >= allowed['starts'][seg]) & (starts[todo] + lengths <= allowed['ends'][seg])
+
+
+def shuffle(annotation, allowed, rng, size=None, max_tries=MAX_TRIES, gc=None):
+    # chrom-preserving, non-overlapping, blacklist-excluding placement by rejection sampling;
+    # every valid start on the interval's chromosome is equally likely, as with bedtools shuffle.
+    # size=K returns a (K, n) matrix holding K independent shuffles; passing K generators as rng
+    # makes each row depend only on its own generator, however the rows are blocked.
+    # with a gc index (and an annotation from gc_index.match_gc) each interval instead starts in a
+    # random window of its GC stratum anywhere in the genome, so chromosomes are not preserved
+    n = len(annotation['chrom'])
+    k = 1 if size is None else size
+    starts = np.empty(n * k, dtype=np.int64)
+    todo = np.arange(n * k)
+
+    # rows are laid end to end so that one sorted array holds the placed intervals of every shuffle;
+    # placed intervals never overlap, so their ends are sorted too
+    span = int(allowed['ends'][-1]) if len(allowed['ends']) else 0
+    placed_keys = placed_ends = np.zeros(0, dtype=np.int64)
+
+    for _ in range(max_tries):
+        if len(todo) == 0:
+            break
+
+        lengths = annotation['length'][todo % n]
+        fits = draw_starts(annotation, allowed, rng, todo, n, k, lengths, starts, gc)
+
+        # only the intervals drawn this round are sorted; they are checked against the placed
+        # interval at or before them and the one after them
+        cand = todo[fits]
+        keys = starts[cand] + cand // n * span
+        order = np.argsort(keys, kind='stable')
+        cand, keys = cand[order], keys[order]
+        ends = keys + lengths[fits][order]
+
+        at = np.searchsorted(placed_keys, keys, side='right')
+        clash = np.zeros(len(cand), dtype=bool)
+        if len(placed_keys):
+            clash |= (at > 0) & (placed_ends[np.maximum(at - 1, 0)] > keys)
+            clash |= (at < len(placed_keys)) & (placed_keys[np.minimum(at, len(placed_keys) - 1)] < ends)
+
+        # among the new intervals that fit, redraw any that overlaps an earlier one
+        free = np.flatnonzero(~clash)
+        prev_end = np.maximum.accumulate(ends[free])
+        clash[free[1:]] = keys[free[1:]] < prev_end[:-1]
+
+        placed_keys = np.insert(placed_keys, at[~clash], keys[~clash])
+        placed_ends = np.insert(placed_ends, at[~clash], ends[~clash])
+        todo = np.sort(np.concatenate((todo[~fits], cand[clash])))
+
+    if len(todo):
+        raise ShuffleError('could not place {} intervals after {} tries'.format(len(todo), max_tries))
+
+    return starts if size is None else starts.reshape(k, n)
+
+
+###
+#   overlaps
+###
+def query_coords(annotation, starts, genome, stranded=False):
+    if stranded:
+        starts = starts + annotation['strand'] * genome['length']
+    return starts, starts + annotation['length']
+
+
+def coverage(index, x):
+    # total test bp (with multiplicity) lying before each position x
+    ks = np.searchsorted(index['starts'], x, side='left')
+    ke = np.searchsorted(index['ends'], x, side='left')
+    return (ks - ke) * x - index['start_sums'][ks] + index['end_sums'][ke]
+
+
+def overlap_bp(index, qs, qe):
+    return coverage(index, qe) - coverage(index, qs)
+
+
+def overlap_count(index, qs, qe):
+    return np.searchsorted(index['starts'], qe, side='left') - np.searchsorted(index['ends'], qs, side='right')
+
+
+def overlap_pairs(index, qs, qe):
+    # every overlapping (query, test) pair; test is a position in start order.
+    # candidates start before the query end and follow the last test interval ending before the query
+    hi = np.searchsorted(index['starts'], qe, side='left')
+    lo = np.searchsorted(index['max_ends'], qs, side='right')
+    counts = np.maximum(hi - lo, 0)
+
+    query = np.repeat(np.arange(len(qs)), counts)
+    cand = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+    hit = index['start_order_ends'][cand] > qs[query]
+
+    return query[hit], cand[hit]
+
+
+def overlap_labels(index, qs, qe):
+    query, cand = overlap_pairs(index, qs, qe)
+    return query, index['labels'][cand]
+
+
+def count_overlaps(index, qs, qe, elementwise, hapblock):
+    # qs/qe hold either one set of intervals or a (K, n) block with one shuffle per row
+    block_qs, block_qe = np.atleast_2d(qs), np.atleast_2d(qe)
+    k, n = block_qs.shape
+
+    if elementwise:
+        counts = (overlap_count(index, block_qs, block_qe) > 0).sum(axis=1)
+    elif hapblock:
+        # distinct (row, label) pairs, then the number of labels seen by each row
+        query, labels = overlap_labels(index, block_qs.ravel(), block_qe.ravel())
+        num_labels = max(len(index['label_names']), 1)
+        pairs = np.unique(query // max(n, 1) * num_labels + labels)
+        counts = np.bincount(pairs // num_labels, minlength=k)
+    else:
+        counts = overlap_bp(index, block_qs, block_qe).sum(axis=1)
+
+    return int(counts[0]) if np.ndim(qs) == 1 else counts
+
+
+def count_overlaps_grouped(index, qs, qe, elementwise, hapblock):
+    # count_overlaps for every group of a grouped index in one pass over the overlapping pairs;
+    # returns one count per group, or a (K, groups) block for a (K, n) block of shuffles
+    block_qs, block_qe = np.atleast_2d(qs), np.atleast_2d(qe)
+    k, n = block_qs.shape
+    num_groups = max(len(index['group_names']), 1)
+    flat_qs, flat_qe = block_qs.ravel(), block_qe.ravel()
+
+    query, cand = overlap_pairs(index, flat_qs, flat_qe)
+    groups = index['groups'][cand]
+    cells = query // max(n, 1) * num_groups + groups # (row, group)
+
+    if elementwise:
+        # each query interval counts once per group it touches
+        pairs = np.unique(query * num_groups + groups)
+        counts = np.bincount(pairs // num_groups // max(n, 1) * num_groups + pairs % num_groups, minlength=k * num_groups)
+    elif hapblock:
+        num_labels = max(len(index['label_names']), 1)
+        pairs = np.unique(cells * num_labels + index['labels'][cand])
+        counts = np.bincount(pairs // num_labels, minlength=k * num_groups)
+    else:
+        bp = np.minimum(flat_qe[query], index['start_order_ends'][cand]) - np.maximum(flat_qs[query], index['starts'][cand])
+        counts = np.bincount(cells, weights=bp, minlength=k * num_groups).astype(np.int64)
+
+    counts = counts.reshape(k, num_groups)
+    return counts[0] if np.ndim(qs) == 1 else counts
+
+
+###
+#   simulations
+###
+def count_placed(index, annotation, genome, starts, elementwise, hapblock, stranded=False):
+    # overlap counts of the annotation placed at starts (its own starts, or a (K, n) block of
+    # shuffles); a grouped index gives one count per group from the same pass over the overlaps
+    qs, qe = query_coords(annotation, starts, genome, stranded)
+    if 'groups' in index:
+        return count_overlaps_grouped(index, qs, qe, elementwise, hapblock)
+    return count_overlaps(index, qs, qe, elementwise, hapblock)
+
+
+def shuffle_block(annotation, allowed, seed, block, gc=None):
+    # shuffles first..last-1 of a run, each from its own iteration_seed stream
+    first, last = block
+    rng = [np.random.default_rng(iteration_seed(seed, i)) for i in range(first, last)]
+    return shuffle(annotation, allowed, rng, size=last - first, gc=gc)
+
+
+def failed_counts(index, size):
+    # -999 for every iteration (and group) of a block that could not be shuffled
+    shape = (size, len(index['group_names'])) if 'groups' in index else size
+    return np.full(shape, -999, dtype=np.int64)
+
+
+def simulate_block(index, allowed, annotation, genome, elementwise, hapblock, stranded, seed, block, gc=None):
+    # one count (or one row of group counts) per iteration of the block
+    try:
+        rand_starts = shuffle_block(annotation, allowed, seed, block, gc)
+    except ShuffleError:
+        return failed_counts(index, block[1] - block[0])
+    return count_placed(index, annotation, genome, rand_starts, elementwise, hapblock, stranded)
@@ -1,20 +1,31 @@
-#!/usr/env/bin python
+#!/bin/python
 #
 # Mary Lauren Benton, 2016
 #
 # This script will pull selected columns from an input file and generate a BED
 # file for downstream analysis.
+#
+# Columns are checked once against the first data line and a single row formatter
+# is built from them, so each line is one split and one format call. Output is
+# written in chunks; .gz input/output is read/written through gzip. Lines starting
+# with '#' are skipped.
 
 import sys
+import gzip
+import time
 import argparse
+import itertools
+from operator import itemgetter
 
 def parseArguments():
     parser = argparse.ArgumentParser(description='Parses input file into BED format', epilog="// mary lauren benton")
     reqgrp = parser.add_argument_group('required arguments')
     optgrp = parser.add_argument_group('other positional arguments')
 
-    reqgrp.add_argument("-i", "--input", help="name of input file", nargs='?', dest="infile",  type=argparse.FileType('r'), required=True)
-    parser.add_argument("-o", "--output", help="name of output file (default: stdout)", nargs='?', dest="outfile", type=argparse.FileType('w'), default=sys.stdout)
+    reqgrp.add_argument("-i", "--input", help="name of input file ('-' for stdin; .gz is decompressed)", dest="infile", type=str, required=True)
+    parser.add_argument("-o", "--output", help="name of output file (default: stdout; .gz is compressed)", dest="outfile", type=str, default='-')
+    parser.add_argument("--chunk_size", help="lines converted per write (default: 100000)", type=int, default=100000)
+    parser.add_argument("--pandas", help="convert with chunked pandas reads; needs the same number of columns on every line", action='store_true', default=False)
 
     reqgrp.add_argument("chrom", type=int, help="idx of column with chromosome name", default=-1)
     reqgrp.add_argument("start", type=int, help="idx of column with start coordinate", default=-1)
@@ -29,42 +40,109 @@ def parseArguments():
 
 def checkBounds(args, numCol):
     if not (0 < args.chrom <= numCol):
-        print "Invalid index value (chrom): %d" % (args.chrom)
-        sys.exit(1)
+        sys.exit("Invalid index value (chrom): %d" % (args.chrom))
     elif not (0 < args.start <= numCol):
-        print "Invalid index value (start): %d" % (args.start)
-        sys.exit(1)
+        sys.exit("Invalid index value (start): %d" % (args.start))
     elif not (0 < args.end <= numCol):
-        print "Invalid index value (end): %d" % (args.end)
-        sys.exit(1)
+        sys.exit("Invalid index value (end): %d" % (args.end))
     elif args.score < -1 or args.score == 0 or args.score > numCol:
-        print "Invalid index value (score): %d" % (args.score)
-        sys.exit(1)
-    elif args.strand < -1 or args.score == 0 or args.strand > numCol:
-        print "Invalid index value (strand): %d" % (args.strand)
-        sys.exit(1)
+        sys.exit("Invalid index value (score): %d" % (args.score))
+    elif args.strand < -1 or args.strand == 0 or args.strand > numCol:
+        sys.exit("Invalid index value (strand): %d" % (args.strand))
 
 def idx(i): # assumes numbering from 1
     return i - 1
 
-def generateBED(args, n):
-    if args.score == -1 and args.strand == -1:
-        args.outfile.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(n[idx(args.chrom)], n[idx(args.start)], n[idx(args.end)], args.name, '.', '.'))
-    elif args.score == -1:
-        args.outfile.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(n[idx(args.chrom)], n[idx(args.start)], n[idx(args.end)], args.name, '.', n[idx(args.strand)]))
-    elif args.strand == -1:
-        args.outfile.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(n[idx(args.chrom)], n[idx(args.start)], n[idx(args.end)], args.name, n[idx(args.score)], '.'))
-    else:
-        args.outfile.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(n[idx(args.chrom)], n[idx(args.start)], n[idx(args.end)], args.name, n[idx(args.score)], n[idx(args.strand)]))
+def openFile(filename, mode):
+    if filename == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode + 't')
+    return open(filename, mode, buffering=1 << 20)
+
+def outputColumns(args):
+    # input columns copied to the output, in BED order
+    return [idx(c) for c in (args.chrom, args.start, args.end, args.score, args.strand) if c != -1]
+
+def rowFormatter(args):
+    # one template and one itemgetter replace the per-line choice between score/strand layouts
+    name = args.name.replace('{', '{{').replace('}', '}}')
+    template = '{}\t{}\t{}\t' + name + '\t' + ('{}' if args.score != -1 else '.') + '\t' + ('{}' if args.strand != -1 else '.') + '\n'
+    getter, fmt = itemgetter(*outputColumns(args)), template.format
+
+    return lambda n: fmt(*getter(n))
+
+class Prepended:
+    # file-like wrapper that puts back the line read by firstDataLine
+    def __init__(self, line, infile):
+        self.line, self.infile = line, infile
+
+    def read(self, size=-1):
+        if self.line:
+            line, self.line = self.line, ''
+            return line
+        return self.infile.read(size)
+
+def firstDataLine(args, infile):
+    for line in infile:
+        if not line.startswith('#'):
+            checkBounds(args, len(line.strip().split('\t'))) # boundary checking for column values (assumes numbered from 1)
+            return line
+    return None
+
+def generateBED(args, infile, outfile):
+    first = firstDataLine(args, infile)
+    if first is None:
+        return 0
+
+    formatRow = rowFormatter(args)
+
+    count = 0
+    lines = itertools.chain([first], (line for line in infile if not line.startswith('#')))
+    while True:
+        chunk = list(itertools.islice(lines, args.chunk_size))
+        if not chunk:
+            return count
+        try:
+            outfile.write(''.join([formatRow(line.strip().split('\t')) for line in chunk]))
+        except IndexError:
+            sys.exit("Line with too few columns after line %d" % (count))
+        count += len(chunk)
+
+def generateBEDPandas(args, infile, outfile):
+    import pandas as pd
+
+    first = firstDataLine(args, infile)
+    if first is None:
+        return 0
+
+    count = 0
+    columns = sorted(set(outputColumns(args)))
+    reader = pd.read_csv(Prepended(first, infile), sep='\t', header=None, dtype=str, usecols=columns, chunksize=args.chunk_size)
+    for chunk in reader:
+        chunk = chunk[~chunk[idx(args.chrom)].str.startswith('#')]
+        bed = pd.DataFrame({'chrom': chunk[idx(args.chrom)], 'start': chunk[idx(args.start)], 'end': chunk[idx(args.end)],
+                            'name': args.name,
+                            'score': chunk[idx(args.score)] if args.score != -1 else '.',
+                            'strand': chunk[idx(args.strand)] if args.strand != -1 else '.'})
+        bed.to_csv(outfile, sep='\t', header=False, index=False)
+        count += len(bed)
+
+    return count
 
 def main():
     args = parseArguments()
+    infile, outfile = openFile(args.infile, 'r'), openFile(args.outfile, 'w')
+
+    begin = time.perf_counter()
+    count = generateBEDPandas(args, infile, outfile) if args.pandas else generateBED(args, infile, outfile)
+    elapsed = time.perf_counter() - begin
 
-    for line in args.infile:
-        n = line.strip().split('\t')
-        checkBounds(args, len(n)) # boundary checking for column values (assumes numbered from 1)
-        generateBED(args, n)
+    for f in (infile, outfile):
+        if f not in (sys.stdin, sys.stdout):
+            f.close()
+
+    print("converted %d lines in %.2f s (%.0f lines/s)" % (count, elapsed, count / elapsed if elapsed else 0), file=sys.stderr)
 
 if __name__ == "__main__":
     main()
-
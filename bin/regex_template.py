@@ -1,43 +1,180 @@
 #!/bin/python
 #
 # Mary Lauren Benton, 2018
+# updated 2026.10.18
+#
+# pull regex capture groups out of large text dumps; the input is memory-mapped (or
+# streamed, when gzipped), cut into newline-aligned chunks and searched line by line
+# with every pattern in a process pool; the unique matches are merged and written
+# sorted under the usual header, and the lines/s rate is reported on stderr
+#
+# python regex_template.py -i file.dat -p 'gene_id "(\w+)"' -p 'rs(\d+)' -n 8
 #
 
-import re
+import os
+import sys
+import mmap
+import gzip
+import time
+import argparse
 import datetime
+import re
+from collections import deque
+from multiprocessing import Pool
+
+###
+#  ARGUMENTS
+###
+arg_parser = argparse.ArgumentParser(description="Collect the unique regex matches in a (gzipped) text file.")
+
+arg_parser.add_argument('-i', '--infile', type=str, default='file.dat',
+                        help='input text file, optionally gzipped | default = file.dat')
+arg_parser.add_argument('-p', '--pattern', type=str, action='append', required=True,
+                        help='regex to search each line for; repeat for several patterns | required')
+arg_parser.add_argument('-o', '--outfile', type=str, default='./file.out',
+                        help='output file | default = ./file.out')
+arg_parser.add_argument('--case_sensitive', action='store_true', default=False,
+                        help='match case exactly | default = False (ignore case)')
+arg_parser.add_argument('--all', action='store_true', default=False,
+                        help='take every match on a line rather than the first | default = False')
+arg_parser.add_argument('--chunk_mb', type=float, default=64,
+                        help='size of the chunks handed to each worker in MB | default = 64')
+arg_parser.add_argument('-n', '--num_threads', type=int, help='number of threads | default = SLURM_CPUS_PER_TASK or 1')
+
+args = arg_parser.parse_args()
+
+# a bad pattern would fail in init_worker and the pool would keep respawning workers
+for pattern in args.pattern:
+    try:
+        re.compile(pattern, flags=0 if args.case_sensitive else re.IGNORECASE)
+    except re.error as e:
+        arg_parser.error('invalid pattern {!r}: {}'.format(pattern, e))
+
+# compiled in each worker by init_worker
+REGEXES = None
+FIND_ALL = False
 
 ###
 #  FUNCTIONS
 ###
 
-# returns list with text from all capture groups
+# returns text from all capture groups (the whole match for patterns without groups)
 def match_to_string(m):
+    if not m.groups():
+        return m.group(0).lower()
     return ' '.join([g.lower() for g in m.groups() if g is not None])
 
-def print_to_file(codes):
-    with open('./file.out', 'w') as outfile:
+def print_to_file(codes, filename):
+    with open(filename, 'w') as outfile:
         outfile.write('###\n'
                       '#  author: [ name ] \n'
                       '#  date:   {}\n'
-                      '#  output: file.out\n'
+                      '#  output: {}\n'
                       '###\n'
-                      .format(str(datetime.datetime.now())[:10]))
+                      .format(str(datetime.datetime.now())[:10], os.path.basename(filename)))
         for c in sorted(codes): outfile.write(c + '\n')
 
+def init_worker(patterns, flags, find_all):
+    global REGEXES, FIND_ALL
+    REGEXES = [re.compile(p, flags=flags) for p in patterns]
+    FIND_ALL = find_all
+
+def chunk_bounds(mm, chunk_size):
+    # (start, end) byte ranges of about chunk_size, each ending just after a newline
+    bounds, start = [], 0
+    while start < len(mm):
+        end = mm.find(b'\n', min(start + chunk_size, len(mm)) - 1)
+        end = len(mm) if end < 0 else end + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+def mapped_chunks(filename, chunk_size):
+    if os.path.getsize(filename) == 0:
+        return []
+    with open(filename, 'rb') as infile, mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return [(filename, start, end) for start, end in chunk_bounds(mm, chunk_size)]
+
+def streamed_chunks(filename, chunk_size):
+    # decompressed chunks of about chunk_size; a partial last line waits for the next read
+    rest = b''
+    with gzip.open(filename, 'rb') as infile:
+        while True:
+            block = infile.read(chunk_size)
+            if not block:
+                break
+            block = rest + block
+            cut = block.rfind(b'\n') + 1
+            if cut == 0:
+                rest = block
+                continue
+            rest = block[cut:]
+            yield block[:cut]
+    if rest:
+        yield rest
+
+def search_chunk(task):
+    # a chunk is either mapped bytes (filename, start, end) of a plain file or decompressed bytes
+    if isinstance(task, tuple):
+        filename, start, end = task
+        with open(filename, 'rb') as infile, mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[start:end]
+    else:
+        data = task
+    text = data.decode('utf-8', errors='replace')
+
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+
+    results = set()
+    for line in lines:
+        for regex in REGEXES:
+            if FIND_ALL:
+                results.update(match_to_string(m) for m in regex.finditer(line))
+            else:
+                m = regex.search(line)
+                if m is not None:
+                    # can take any action with line/match here
+                    results.add(match_to_string(m))
+
+    return results, len(lines)
+
 ###
 #  MAIN
 ###
-pattern = 'regex here'
-regex   = re.compile(pattern, flags=re.IGNORECASE) # if case sensitive remove flag
+def main(argv):
+    num_threads = args.num_threads if args.num_threads else int(os.getenv('SLURM_CPUS_PER_TASK', 1))
+    chunk_size = max(1, int(args.chunk_mb * 2**20))
+    flags = 0 if args.case_sensitive else re.IGNORECASE
+
+    if args.infile.endswith('.gz'):
+        chunks = streamed_chunks(args.infile, chunk_size)
+    else:
+        chunks = mapped_chunks(args.infile, chunk_size)
 
-results = []
+    results = set()
+    num_lines = 0
+    begin = time.perf_counter()
+    with Pool(num_threads, initializer=init_worker, initargs=(args.pattern, flags, args.all)) as pool:
+        # at most two chunks per worker are read ahead, so gzipped input stays streamed
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(search_chunk, (chunk,)))
+            while len(pending) > 2 * num_threads or (pending and pending[0].ready()):
+                chunk_results, chunk_lines = pending.popleft().get()
+                results |= chunk_results
+                num_lines += chunk_lines
+        for result in pending:
+            chunk_results, chunk_lines = result.get()
+            results |= chunk_results
+            num_lines += chunk_lines
+    elapsed = time.perf_counter() - begin
 
-with open('file.dat', 'r') as data_file:
-    for line in data_file:
-        m = regex.search(line)  # finds all occurences
-        if m is not None:
-            # can take any action with line/match here
-            results.add(match_to_string(m))
+    print_to_file(results, args.outfile)
+    print('{} lines in {:.2f}s ({:.0f} lines/s), {} unique matches'.format(
+          num_lines, elapsed, num_lines / max(elapsed, 1e-9), len(results)), file=sys.stderr)
 
-print_to_file(results)
 
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,188 @@
+#!/bin/python
+###
+#   name    | mary lauren benton
+#   created | 2026.10.18
+#
+#   single-pass replacement for adv_unix_tutorial/bin/summary_stats_bed: bp,
+#   elements, mean, median and other percentiles of the interval lengths of each
+#   BED file, optionally per chromosome, with files read in parallel
+#
+#   each file is read once in chunks; lengths go into a bounded histogram that is
+#   exact below EXACT_LIMIT bp and has log-spaced buckets (relative error under
+#   (GAMMA - 1) / 2) above it, so memory does not grow with the file. histograms
+#   only hold the buckets seen, and per-chromosome ones are only kept with
+#   --by_chrom, so assemblies with many contigs stay small. --exact keeps
+#   every length instead. percentiles use the same rank as the shell script's
+#   median: the sorted length at position int(p / 100 * n)
+#
+#   depends on:
+#       numpy
+#       bed_reader.py (same directory)
+###
+
+import os
+import sys
+import argparse
+import numpy as np
+from collections import Counter
+from multiprocessing import Pool
+
+from bed_reader import CHUNK_SIZE, iter_bed
+
+
+# lengths below this many bp are counted exactly
+EXACT_LIMIT = 4096
+
+# ratio between successive buckets above EXACT_LIMIT
+GAMMA = 1.01
+
+# log-spaced buckets, enough for lengths up to 2^42 bp
+NUM_BUCKETS = EXACT_LIMIT + int(np.ceil(np.log(2.0**42 / EXACT_LIMIT) / np.log(GAMMA)))
+
+
+###
+#   arguments
+###
+arg_parser = argparse.ArgumentParser(description="Print summary statistics of interval lengths for BED files.")
+
+arg_parser.add_argument("bed_files", nargs='+', help='BED files (optionally gzipped)')
+arg_parser.add_argument("-p", "--percentiles", type=float, nargs='+', default=[25, 75, 90, 99],
+                        help='percentiles reported after the median; default=25 75 90 99')
+arg_parser.add_argument("--by_chrom", action='store_true', default=False,
+                        help='also report every chromosome of each file; default=False')
+arg_parser.add_argument("--exact", action='store_true', default=False,
+                        help='keep every length for exact percentiles (memory grows with the file); default=False')
+arg_parser.add_argument("--chunk_size", type=int, default=CHUNK_SIZE,
+                        help='lines read per chunk; default={}'.format(CHUNK_SIZE))
+arg_parser.add_argument("-n", "--num_threads", type=int,
+                        help='number of files read at once; default=SLURM_CPUS_PER_TASK or 1')
+
+args = arg_parser.parse_args()
+
+
+###
+#   functions
+###
+def bucket_index(lengths):
+    log_bucket = EXACT_LIMIT + np.ceil(np.log(np.maximum(lengths, EXACT_LIMIT) / EXACT_LIMIT) / np.log(GAMMA)).astype(np.int64)
+    return np.minimum(np.where(lengths < EXACT_LIMIT, lengths, log_bucket), NUM_BUCKETS - 1)
+
+
+def bucket_value(index):
+    # representative length of a bucket: itself below EXACT_LIMIT, else the point with equal
+    # relative distance to both bucket edges
+    if index < EXACT_LIMIT:
+        return int(index)
+    return int(round(EXACT_LIMIT * GAMMA ** (index - EXACT_LIMIT) * 2 / (1 + GAMMA)))
+
+
+def new_stats(exact):
+    stats = {'elements': 0, 'bp': 0}
+    if exact:
+        stats['lengths'] = []
+    else:
+        # bucket -> count, for the buckets seen only
+        stats['hist'] = Counter()
+    return stats
+
+
+def add_lengths(stats, lengths):
+    stats['elements'] += len(lengths)
+    stats['bp'] += int(lengths.sum())
+    if 'lengths' in stats:
+        stats['lengths'].append(lengths)
+    else:
+        buckets, counts = np.unique(bucket_index(lengths), return_counts=True)
+        stats['hist'].update(dict(zip(buckets.tolist(), counts.tolist())))
+
+
+def finish_lengths(stats):
+    if 'lengths' in stats:
+        stats['lengths'] = np.concatenate(stats['lengths']) if stats['lengths'] else np.zeros(0, dtype=np.int64)
+    return stats
+
+
+def file_stats(filename, exact, chunk_size, by_chrom):
+    # stats of one file and, with by_chrom, of each chromosome in order of first appearance
+    total = new_stats(exact)
+    chroms = []
+    codes = {}
+    for chunk in iter_bed(filename, codes=codes, chunk_size=chunk_size):
+        lengths = chunk['end'] - chunk['start']
+        if (lengths < 0).any():
+            raise ValueError('{}: {} intervals end before they start'.format(filename, int((lengths < 0).sum())))
+
+        if not by_chrom:
+            add_lengths(total, lengths)
+            continue
+
+        chroms.extend(new_stats(exact) for _ in range(len(codes) - len(chroms)))
+        order = np.argsort(chunk['chrom_code'], kind='stable')
+        present, first = np.unique(chunk['chrom_code'][order], return_index=True)
+        for code, piece in zip(present, np.split(lengths[order], first[1:])):
+            add_lengths(chroms[code], piece)
+
+    chroms = [finish_lengths(stats) for stats in chroms]
+    total = combine(chroms, exact) if by_chrom else finish_lengths(total)
+
+    return filename, sorted(codes, key=codes.get), total, chroms
+
+
+def read_file(filename):
+    return file_stats(filename, args.exact, args.chunk_size, args.by_chrom)
+
+
+def combine(chroms, exact):
+    total = new_stats(exact)
+    total['elements'] = sum(s['elements'] for s in chroms)
+    total['bp'] = sum(s['bp'] for s in chroms)
+    if exact:
+        total['lengths'] = np.concatenate([s['lengths'] for s in chroms]) if chroms else np.zeros(0, dtype=np.int64)
+    else:
+        for s in chroms:
+            total['hist'].update(s['hist'])
+    return total
+
+
+def percentile_values(stats, percentiles):
+    n = stats['elements']
+    if n == 0:
+        return ['NA'] * len(percentiles)
+    ranks = [min(int(p / 100 * n), n - 1) for p in percentiles]
+
+    if 'lengths' in stats:
+        values = np.partition(stats['lengths'], ranks)
+        return [str(int(values[r])) for r in ranks]
+
+    buckets = sorted(stats['hist'])
+    cum = np.cumsum([stats['hist'][b] for b in buckets])
+    return [str(bucket_value(buckets[np.searchsorted(cum, r, side='right')])) for r in ranks]
+
+
+def format_row(filename, chrom, stats, percentiles):
+    mean = '{:.3f}'.format(stats['bp'] / stats['elements']) if stats['elements'] else 'NA'
+    return '\t'.join([filename, chrom, str(stats['bp']), str(stats['elements']), mean] +
+                     percentile_values(stats, percentiles)) + '\n'
+
+
+###
+#   main
+###
+def main(argv):
+    num_threads = args.num_threads if args.num_threads else int(os.getenv('SLURM_CPUS_PER_TASK', 1))
+    percentiles = [50] + args.percentiles
+
+    sys.stdout.write('\t'.join(['file', 'chrom', 'bp', 'elements', 'mean', 'median'] +
+                               ['p{:g}'.format(p) for p in args.percentiles]) + '\n')
+
+    # files are reported in the order given, each as soon as it and the files before it are done
+    with Pool(min(num_threads, len(args.bed_files))) as pool:
+        for filename, names, total, chroms in pool.imap(read_file, args.bed_files):
+            sys.stdout.write(format_row(filename, 'all', total, percentiles))
+            if args.by_chrom:
+                sys.stdout.write(''.join(format_row(filename, name, stats, percentiles) for name, stats in zip(names, chroms)))
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])